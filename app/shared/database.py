@@ -6,12 +6,21 @@ Async SQLAlchemy engine and sessionmaker setup for Telegram Insight Agent.
 
 import logging
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from config import settings
 
 logger = logging.getLogger("telegram_insight_agent.database")
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False, future=True)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=False,
+    future=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE_SEC,
+    pool_pre_ping=True,
+)
 async_sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
 
 async def test_db_connection() -> bool:
@@ -23,7 +32,7 @@ async def test_db_connection() -> bool:
     """
     try:
         async with engine.connect() as conn:
-            await conn.execute("SELECT 1")
+            await conn.execute(text("SELECT 1"))
         logger.info("Database connection test succeeded.")
         return True
     except SQLAlchemyError as e:
@@ -45,9 +54,3 @@ async def test_create_session():
 async def test_db_connection_func():
     assert await test_db_connection() in (True, False)
 """
-from config import settings
-
-DATABASE_URL = settings.DATABASE_URL
-
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
-async_sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False)
\ No newline at end of file
@@ -1,15 +1,23 @@
 import logging
-from datetime import datetime
-from typing import Optional, List, Any
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Any, Tuple
 
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, or_, case, func, literal_column
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 from app.shared.db_models import MonitoredChat, UserSettings
+from config import settings
 
 logger = logging.getLogger(__name__)
 
+_ONE_SECOND = literal_column("interval '1 second'")
+
+def _initial_next_run_at(interval_sec: int) -> datetime:
+    # A random phase within one interval spreads chats evenly instead of bunching them
+    return datetime.now(timezone.utc) + timedelta(seconds=random.uniform(0, interval_sec))
+
 # --- MonitoredChat CRUD ---
 
 async def add_monitored_chat(
@@ -32,6 +40,7 @@ async def add_monitored_chat(
         prompt=prompt,
         last_processed_message_id=last_processed_message_id,
         is_active=is_active,
+        next_run_at=_initial_next_run_at(settings.SCHEDULE_DEFAULT_INTERVAL_SEC),
     )
     try:
         session.add(mc)
@@ -140,6 +149,150 @@ async def set_chat_active(session: AsyncSession, user_id: int, chat_id: int, is_
         await session.rollback()
         return 0
 
+async def advance_last_processed_message_id(session: AsyncSession, monitored_chat_id: int, message_id: int) -> int:
+    """
+    Atomically move a monitored chat's watermark forward to message_id.
+
+    The update is a single conditional UPDATE, so a concurrent or stale run can
+    never move the watermark backwards.
+    """
+    logger.info(f"Advancing watermark for monitored_chat_id={monitored_chat_id} to message_id={message_id}")
+    try:
+        stmt = (
+            update(MonitoredChat)
+            .where(
+                MonitoredChat.id == monitored_chat_id,
+                or_(
+                    MonitoredChat.last_processed_message_id.is_(None),
+                    MonitoredChat.last_processed_message_id < message_id,
+                ),
+            )
+            .values(last_processed_message_id=message_id)
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        logger.info(f"Advanced watermark for {result.rowcount} chat(s)")
+        return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"DB error in advance_last_processed_message_id: {e}")
+        await session.rollback()
+        return 0
+
+async def reset_last_processed_message_id(session: AsyncSession, user_id: int, chat_id: int) -> int:
+    """
+    Clear a monitored chat's watermark so the next run does a full export.
+    """
+    logger.info(f"Resetting watermark for user_id={user_id}, chat_id={chat_id}")
+    try:
+        stmt = (
+            update(MonitoredChat)
+            .where(MonitoredChat.user_id == user_id, MonitoredChat.chat_id == chat_id)
+            .values(last_processed_message_id=None)
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        logger.info(f"Reset watermark for {result.rowcount} chat(s)")
+        return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"DB error in reset_last_processed_message_id: {e}")
+        await session.rollback()
+        return 0
+
+async def set_dedup_threshold(session: AsyncSession, user_id: int, chat_id: int, threshold: Optional[int]) -> int:
+    """
+    Set a monitored chat's near-duplicate threshold (None restores the default).
+    """
+    logger.info(f"Setting dedup_threshold={threshold} for user_id={user_id}, chat_id={chat_id}")
+    try:
+        stmt = (
+            update(MonitoredChat)
+            .where(MonitoredChat.user_id == user_id, MonitoredChat.chat_id == chat_id)
+            .values(dedup_threshold=threshold)
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        logger.info(f"Set dedup_threshold for {result.rowcount} chat(s)")
+        return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"DB error in set_dedup_threshold: {e}")
+        await session.rollback()
+        return 0
+
+async def set_schedule_interval(session: AsyncSession, user_id: int, chat_id: int, interval_sec: Optional[int]) -> int:
+    """
+    Set a monitored chat's run interval (None restores the default) and re-phase its next run.
+    """
+    logger.info(f"Setting schedule_interval_sec={interval_sec} for user_id={user_id}, chat_id={chat_id}")
+    try:
+        stmt = (
+            update(MonitoredChat)
+            .where(MonitoredChat.user_id == user_id, MonitoredChat.chat_id == chat_id)
+            .values(
+                schedule_interval_sec=interval_sec,
+                next_run_at=_initial_next_run_at(interval_sec or settings.SCHEDULE_DEFAULT_INTERVAL_SEC),
+            )
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        logger.info(f"Set schedule interval for {result.rowcount} chat(s)")
+        return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"DB error in set_schedule_interval: {e}")
+        await session.rollback()
+        return 0
+
+async def claim_due_chats(session: AsyncSession, limit: int) -> List[Tuple[int, int]]:
+    """
+    Claim up to `limit` due active chats and move their next_run_at forward.
+
+    Due rows are selected through the next_run_at index and locked with
+    FOR UPDATE SKIP LOCKED, so concurrent schedulers never claim the same chat. The
+    next run keeps the chat's phase (previous due time plus its interval) shifted by a
+    symmetric random jitter; a chat that fell a whole interval behind is rescheduled
+    from now instead of being replayed.
+
+    Does not commit: the caller commits once the runs are enqueued, so a failed
+    enqueue releases the claim.
+
+    Args:
+        session: Async DB session.
+        limit: Maximum number of chats to claim.
+
+    Returns:
+        List of (monitored chat id, user id) claimed.
+    """
+    now = func.now()
+    interval = func.coalesce(MonitoredChat.schedule_interval_sec, settings.SCHEDULE_DEFAULT_INTERVAL_SEC) * _ONE_SECOND
+    jitter = func.coalesce(MonitoredChat.schedule_jitter_sec, settings.SCHEDULE_DEFAULT_JITTER_SEC) * _ONE_SECOND
+    phased = func.coalesce(MonitoredChat.next_run_at, now) + interval
+    due = (
+        select(MonitoredChat.id)
+        .where(
+            MonitoredChat.is_active,
+            or_(MonitoredChat.next_run_at.is_(None), MonitoredChat.next_run_at <= now),
+        )
+        .order_by(MonitoredChat.next_run_at.asc().nulls_first())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(MonitoredChat)
+        .where(MonitoredChat.id.in_(due))
+        .values(next_run_at=case((phased > now, phased), else_=now + interval) + (func.random() - 0.5) * jitter)
+        .returning(MonitoredChat.id, MonitoredChat.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        result = await session.execute(stmt)
+        claimed = [(row[0], row[1]) for row in result.all()]
+        logger.debug(f"Claimed {len(claimed)} due chat(s)")
+        return claimed
+    except SQLAlchemyError as e:
+        logger.error(f"DB error in claim_due_chats: {e}")
+        await session.rollback()
+        return []
+
 async def get_latest_run_status(session: AsyncSession, user_id: int) -> List[Any]:
     """
     Dummy: Return last processed_message_id for each chat.
@@ -1,30 +1,12 @@
 # SQLAlchemy models for Supabase/Postgres
 
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine, AsyncSession
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import BigInteger, String, Boolean, Text, Integer
-
-class Base(AsyncAttrs, DeclarativeBase):
-    pass
-
-class MonitoredChat(Base):
-    __tablename__ = "monitored_chats"
-
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(BigInteger, index=True)  # Telegram user id
-    chat_id: Mapped[int] = mapped_column(BigInteger, index=True)  # Telegram chat id
-    chat_title: Mapped[str] = mapped_column(String(256))
-    prompt: Mapped[str] = mapped_column(Text)
-    last_processed_message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
-    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
-
 """
 SQLAlchemy ORM models for Telegram Insight Agent.
 """
 
 import logging
 from sqlalchemy import (
-    Column, Integer, BigInteger, String, Text, Boolean, DateTime, UniqueConstraint
+    Column, Integer, BigInteger, String, Text, Boolean, DateTime, Index, UniqueConstraint, text
 )
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column
 from datetime import datetime
@@ -38,7 +20,11 @@ class MonitoredChat(Base):
     Model for monitored Telegram chats.
     """
     __tablename__ = "monitored_chats"
-    __table_args__ = (UniqueConstraint("user_id", "chat_id", name="uq_monitored_chats_user_chat"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "chat_id", name="uq_monitored_chats_user_chat"),
+        # Due-time lookup for the scheduler; same partial index as init_tables.sql
+        Index("ix_monitored_chats_next_run_at", "next_run_at", postgresql_where=text("is_active")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, index=True)
@@ -47,6 +33,12 @@ class MonitoredChat(Base):
     prompt: Mapped[str] = mapped_column(Text, nullable=False)
     last_processed_message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    # Max SimHash distance (bits) for near-duplicate collapsing; NULL = default, <0 = off
+    dedup_threshold: Mapped[int] = mapped_column(Integer, nullable=True)
+    # Schedule: seconds between runs and max random offset per run (NULL = defaults)
+    schedule_interval_sec: Mapped[int] = mapped_column(Integer, nullable=True)
+    schedule_jitter_sec: Mapped[int] = mapped_column(Integer, nullable=True)
+    next_run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
 
     def __repr__(self) -> str:
         return (f"<MonitoredChat(id={self.id}, user_id={self.user_id}, "
@@ -106,15 +98,3 @@ def test_job_status_schema():
     cols = [c.name for c in JobStatus.__table__.columns]
     assert "request_id" in cols and "status" in cols and "created_at" in cols
 """
-
-class JobStatus(Base):
-    __tablename__ = "job_status"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    request_id: Mapped[str] = mapped_column(String(64), unique=True, index=True)
-    user_id: Mapped[int] = mapped_column(BigInteger, index=True)
-    chat_id: Mapped[int] = mapped_column(BigInteger, index=True)
-    chat_title: Mapped[str] = mapped_column(String(256))
-    status: Mapped[str] = mapped_column(String(32))  # e.g. QUEUED, STARTED, RUNNING, SUCCESS, FAILED, CANCELLED
-    detail: Mapped[str] = mapped_column(Text, nullable=True)
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow)
-    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
\ No newline at end of file
@@ -7,9 +7,25 @@ CREATE TABLE IF NOT EXISTS monitored_chats (
     prompt TEXT NOT NULL,
     last_processed_message_id BIGINT,
     is_active BOOLEAN DEFAULT TRUE,
+    dedup_threshold INTEGER,
+    schedule_interval_sec INTEGER,
+    schedule_jitter_sec INTEGER,
+    next_run_at TIMESTAMPTZ,
     UNIQUE(user_id, chat_id)
 );
 
+-- Columns added after the initial schema (no-ops on fresh databases)
+ALTER TABLE monitored_chats ADD COLUMN IF NOT EXISTS dedup_threshold INTEGER;
+ALTER TABLE monitored_chats ADD COLUMN IF NOT EXISTS schedule_interval_sec INTEGER;
+ALTER TABLE monitored_chats ADD COLUMN IF NOT EXISTS schedule_jitter_sec INTEGER;
+ALTER TABLE monitored_chats ADD COLUMN IF NOT EXISTS next_run_at TIMESTAMPTZ;
+
+-- Due-time lookup for the scheduler: only active chats are ever claimed
+CREATE INDEX IF NOT EXISTS ix_monitored_chats_next_run_at ON monitored_chats (next_run_at) WHERE is_active;
+
+-- Spread chats that predate scheduling over the first hour instead of running them all at once
+UPDATE monitored_chats SET next_run_at = now() + random() * interval '1 hour' WHERE next_run_at IS NULL;
+
 -- Create user_settings table for per-user default prompt
 CREATE TABLE IF NOT EXISTS user_settings (
     id BIGSERIAL PRIMARY KEY,
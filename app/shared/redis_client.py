@@ -1,69 +1,146 @@
 # Redis connection & RQ Queue setup
 
+"""
+Process-wide Redis connection pools and RQ queues.
+
+get_redis_sync() and get_redis_async() return lightweight clients over shared pools,
+so hot paths (status publishing, enqueueing, userbot state lookups) reuse open
+connections instead of connecting on every call. Pools are rebuilt after a fork, and
+the async pool is rebuilt when used from a different event loop, since its
+connections belong to the loop that opened them.
+"""
+
+import asyncio
 import logging
-from typing import Any
+import os
+from typing import Any, Dict, Optional
+import redis
 import redis.asyncio as aioredis
 from rq import Queue
 from config import settings
 
 logger = logging.getLogger("telegram_insight_agent.redis_client")
 
+_sync_pool: Optional[redis.BlockingConnectionPool] = None
+_sync_pool_pid: Optional[int] = None
+_async_pool: Optional[aioredis.BlockingConnectionPool] = None
+_async_pool_pid: Optional[int] = None
+_async_pool_loop: Optional[asyncio.AbstractEventLoop] = None
+_queues: Dict[str, Queue] = {}
+
+def _pool_kwargs() -> Dict[str, Any]:
+    return {
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "timeout": settings.REDIS_POOL_TIMEOUT_SEC,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL_SEC,
+        # No read timeout by default: pub/sub listeners and blocking reads idle legitimately
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT_SEC,
+        "socket_connect_timeout": settings.REDIS_CONNECT_TIMEOUT_SEC,
+        "socket_keepalive": True,
+    }
+
+def _get_sync_pool() -> redis.BlockingConnectionPool:
+    global _sync_pool, _sync_pool_pid
+    if _sync_pool is None or _sync_pool_pid != os.getpid():
+        logger.info(f"Creating Redis sync pool (max_connections={settings.REDIS_MAX_CONNECTIONS})")
+        # RQ needs raw bytes, so the sync pool does not decode responses
+        _sync_pool = redis.BlockingConnectionPool.from_url(settings.REDIS_URL, **_pool_kwargs())
+        _sync_pool_pid = os.getpid()
+        _queues.clear()
+    return _sync_pool
+
+def _get_async_pool() -> aioredis.BlockingConnectionPool:
+    global _async_pool, _async_pool_pid, _async_pool_loop
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    stale = _async_pool is not None and (
+        _async_pool_pid != os.getpid() or (loop is not None and _async_pool_loop is not None and _async_pool_loop is not loop)
+    )
+    if _async_pool is None or stale:
+        if stale:
+            # Connections belong to another process/loop; drop them without touching the sockets
+            logger.info("Discarding Redis async pool bound to another process or event loop")
+        logger.info(f"Creating Redis async pool (max_connections={settings.REDIS_MAX_CONNECTIONS})")
+        _async_pool = aioredis.BlockingConnectionPool.from_url(settings.REDIS_URL, decode_responses=True, **_pool_kwargs())
+        _async_pool_pid = os.getpid()
+        _async_pool_loop = loop
+    elif _async_pool_loop is None and loop is not None:
+        _async_pool_loop = loop
+    return _async_pool
+
 def get_redis_sync() -> Any:
     """
-    Get a synchronous Redis client (for RQ).
+    Get a synchronous Redis client (for RQ) backed by the shared pool.
     """
-    import redis
-    logger.debug(f"Connecting to Redis (sync) at {settings.REDIS_URL}")
+    logger.debug("Getting Redis (sync) client from shared pool")
     try:
-        client = redis.Redis.from_url(settings.REDIS_URL)
-        logger.info("Connected to Redis (sync)")
-        return client
+        return redis.Redis(connection_pool=_get_sync_pool())
     except Exception as e:
         logger.error(f"Error connecting to Redis (sync): {e}")
         raise
 
 def get_redis_async() -> aioredis.Redis:
     """
-    Get an async Redis client (for pub/sub, async ops).
+    Get an async Redis client (for pub/sub, async ops) backed by the shared pool.
+
+    Callers do not need to close it; closing it leaves the pool open.
     """
-    logger.debug(f"Connecting to Redis (async) at {settings.REDIS_URL}")
+    logger.debug("Getting Redis (async) client from shared pool")
     try:
-        client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
-        logger.info("Connected to Redis (async)")
-        return client
+        return aioredis.Redis(connection_pool=_get_async_pool())
     except Exception as e:
         logger.error(f"Error connecting to Redis (async): {e}")
         raise
 
 def get_rq_queue(name: str = "default") -> Queue:
     """
-    Get an RQ queue for background jobs.
+    Get an RQ queue for background jobs (cached per process).
     """
     logger.debug(f"Getting RQ queue: {name}")
     try:
-        queue = Queue(name, connection=get_redis_sync())
-        logger.info(f"Created RQ queue: {name}")
+        connection = get_redis_sync()
+        queue = _queues.get(name)
+        if queue is None:
+            queue = Queue(name, connection=connection)
+            _queues[name] = queue
+            logger.info(f"Created RQ queue: {name}")
         return queue
     except Exception as e:
         logger.error(f"Error creating RQ queue: {e}")
         raise
 
+async def close_redis_pools() -> None:
+    """
+    Disconnect the shared pools owned by this process (call on shutdown).
+    """
+    global _sync_pool, _async_pool, _async_pool_loop
+    if _async_pool is not None and _async_pool_pid == os.getpid():
+        await _async_pool.disconnect()
+        logger.info("Closed Redis async pool")
+    if _sync_pool is not None and _sync_pool_pid == os.getpid():
+        _sync_pool.disconnect()
+        logger.info("Closed Redis sync pool")
+    _async_pool = None
+    _async_pool_loop = None
+    _sync_pool = None
+    _queues.clear()
+
 # --- Pytest skeleton for redis_client ---
 
 """
 import pytest
+from app.shared import redis_client
 from app.shared.redis_client import get_redis_sync, get_redis_async, get_rq_queue
 
-def test_get_redis_sync(monkeypatch):
-    # monkeypatch redis.Redis.from_url to return a mock
-    pass
+def test_get_redis_sync_reuses_pool():
+    assert get_redis_sync().connection_pool is get_redis_sync().connection_pool
 
 @pytest.mark.asyncio
-async def test_get_redis_async(monkeypatch):
-    # monkeypatch aioredis.from_url to return a mock
-    pass
-
-def test_get_rq_queue(monkeypatch):
-    # monkeypatch get_redis_sync and Queue to return a mock queue
-    pass
-"""
\ No newline at end of file
+async def test_get_redis_async_reuses_pool():
+    assert get_redis_async().connection_pool is get_redis_async().connection_pool
+
+def test_get_rq_queue_cached():
+    assert get_rq_queue("default") is get_rq_queue("default")
+"""
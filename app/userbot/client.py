@@ -47,6 +47,21 @@ def register_handlers() -> None:
         logger.debug("Handler: /monitor run")
         await handlers.handle_monitor_run(event)
 
+    @client.on(events.NewMessage(pattern=r"^/monitor reset"))
+    async def _(event: Any):
+        logger.debug("Handler: /monitor reset")
+        await handlers.handle_monitor_reset(event)
+
+    @client.on(events.NewMessage(pattern=r"^/monitor dedup"))
+    async def _(event: Any):
+        logger.debug("Handler: /monitor dedup")
+        await handlers.handle_monitor_dedup(event)
+
+    @client.on(events.NewMessage(pattern=r"^/monitor interval"))
+    async def _(event: Any):
+        logger.debug("Handler: /monitor interval")
+        await handlers.handle_monitor_interval(event)
+
     logger.info("All handlers registered.")
 
 # --- Pytest skeleton ---
@@ -0,0 +1,183 @@
+# Concurrent, per-request-ordered dispatch of job events
+
+"""
+Handle job events concurrently without reordering a request's own events.
+
+Each event is routed by its run (the `run_id` field, else its request_id) to one of
+EVENT_DISPATCH_SHARDS bounded queues, each drained by its own task, so a slow upload
+or a FloodWait for one run only holds up the runs that share its shard, while a run's
+events are still handled in the order they were read. Scheduled runs have no
+request_id; their run_id is per chat, so they spread over the shards too. When a shard's queue is full, submit() waits,
+which stops the stream reader until the shard catches up (backpressure). Lag is the
+time from the event being added to the stream (the millisecond part of its entry id)
+to its handler starting.
+"""
+
+import asyncio
+import logging
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger("telegram_insight_agent.userbot.dispatcher")
+
+# Handler for one stream entry; returns True once the entry is handled (and acknowledged)
+EntryHandler = Callable[[str, Dict[str, str]], Awaitable[bool]]
+
+def entry_lag_sec(entry_id: str, now: Optional[float] = None) -> float:
+    """
+    Seconds since a stream entry was added, from the millisecond part of its id.
+    """
+    try:
+        added_ms = int(entry_id.split("-", 1)[0])
+    except ValueError:
+        return 0.0
+    return max((now if now is not None else time.time()) - added_ms / 1000, 0.0)
+
+class EventDispatcher:
+    """
+    Fan stream entries out to per-shard worker tasks, keyed by run_id.
+    """
+
+    def __init__(self, handler: EntryHandler, shards: int, queue_size: int, lag_warn_sec: float = 0.0) -> None:
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.handler = handler
+        self.shards = shards
+        self.queue_size = queue_size
+        self.lag_warn_sec = lag_warn_sec
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        # Entries queued or being handled, so a re-read or reclaimed entry is not run twice
+        self._pending: Set[str] = set()
+        self.metrics: Dict[str, float] = {"dispatched": 0, "handled": 0, "failed": 0, "blocked": 0, "last_lag_sec": 0.0, "max_lag_sec": 0.0}
+
+    def start(self) -> None:
+        """
+        Start one worker task per shard.
+        """
+        if self._workers:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.shards)]
+        self._workers = [asyncio.create_task(self._work(shard)) for shard in range(self.shards)]
+        logger.info(f"Event dispatcher started with {self.shards} shard(s), queue size {self.queue_size}")
+
+    async def close(self) -> None:
+        """
+        Stop the worker tasks; queued entries stay unacknowledged in the stream.
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers, self._queues = [], []
+        self._pending.clear()
+
+    def shard_for(self, run_id: str) -> int:
+        """
+        Shard index for a run_id (stable across processes).
+        """
+        return zlib.crc32(run_id.encode()) % self.shards
+
+    async def submit(self, entry_id: str, fields: Dict[str, str]) -> None:
+        """
+        Queue an entry on its run's shard, waiting while that shard's queue is full.
+        """
+        if entry_id in self._pending:
+            return
+        self._pending.add(entry_id)
+        # Entries from workers that predate run_id fall back to the request_id
+        run_id = fields.get("run_id") or fields.get("request_id", "")
+        queue = self._queues[self.shard_for(run_id)]
+        if queue.full():
+            self.metrics["blocked"] += 1
+        try:
+            await queue.put((entry_id, fields))
+        except BaseException:
+            self._pending.discard(entry_id)
+            raise
+        self.metrics["dispatched"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters, lag and current per-shard queue depths.
+        """
+        return {**self.metrics, "depths": [q.qsize() for q in self._queues]}
+
+    def _record_lag(self, entry_id: str) -> None:
+        lag = round(entry_lag_sec(entry_id), 3)
+        self.metrics["last_lag_sec"] = lag
+        self.metrics["max_lag_sec"] = max(self.metrics["max_lag_sec"], lag)
+        if self.lag_warn_sec and lag > self.lag_warn_sec:
+            logger.warning(f"Job event {entry_id} dispatched {lag:.1f}s after it was published")
+
+    async def _work(self, shard: int) -> None:
+        queue = self._queues[shard]
+        while True:
+            entry_id, fields = await queue.get()
+            try:
+                self._record_lag(entry_id)
+                handled = await self.handler(entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Dispatcher shard {shard} failed on job event {entry_id}: {e}")
+                handled = False
+            finally:
+                self._pending.discard(entry_id)
+                queue.task_done()
+            self.metrics["handled" if handled else "failed"] += 1
+
+# --- Pytest skeleton ---
+
+"""
+import asyncio
+import pytest
+from app.userbot.dispatcher import EventDispatcher, entry_lag_sec
+
+def test_entry_lag_from_stream_id():
+    assert entry_lag_sec("1000-0", now=3.5) == 2.5
+    assert entry_lag_sec("bad") == 0.0
+
+@pytest.mark.asyncio
+async def test_same_request_in_order_other_requests_concurrent():
+    seen = []
+
+    async def handler(entry_id, fields):
+        await asyncio.sleep(0.1 if fields["request_id"] == "slow" else 0)
+        seen.append(entry_id)
+        return True
+
+    dispatcher = EventDispatcher(handler, shards=8, queue_size=10)
+    dispatcher.start()
+    for i, rid in enumerate(["slow", "slow", "fast"]):
+        await dispatcher.submit(f"{i + 1}-0", {"request_id": rid})
+    await asyncio.sleep(0.3)
+    await dispatcher.close()
+    assert seen.index("1-0") < seen.index("2-0")
+    if dispatcher.shard_for("slow") != dispatcher.shard_for("fast"):
+        assert seen[0] == "3-0"
+
+@pytest.mark.asyncio
+async def test_full_queue_blocks_submit():
+    gate = asyncio.Event()
+
+    async def handler(entry_id, fields):
+        await gate.wait()
+        return True
+
+    dispatcher = EventDispatcher(handler, shards=1, queue_size=1)
+    dispatcher.start()
+    await dispatcher.submit("1-0", {"request_id": "r"})
+    await asyncio.sleep(0)
+    await dispatcher.submit("2-0", {"request_id": "r"})
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(dispatcher.submit("3-0", {"request_id": "r"}), 0.05)
+    gate.set()
+    await dispatcher.close()
+
+def test_scheduled_runs_spread_over_shards():
+    dispatcher = EventDispatcher(None, shards=16, queue_size=1)
+    assert len({dispatcher.shard_for(f"scheduled-{chat}") for chat in range(100)}) > 1
+"""
@@ -1,20 +1,41 @@
-# Listens to Redis Pub/Sub for job completion or progress events
+# Consumes job progress and completion events from the Redis job events stream
+
+"""
+The worker appends status events to a Redis Stream (JOB_EVENTS_STREAM); the userbot
+reads it through the consumer group JOB_EVENTS_GROUP and acknowledges each event once
+handled. Events published while the userbot is down stay in the stream, events it read
+but did not acknowledge before a restart are read again, and events left pending by
+another replica for longer than JOB_EVENTS_CLAIM_IDLE_SEC are claimed. Replicas in the
+same group share the events.
+
+Entries are handed to an EventDispatcher (app.userbot.dispatcher), which handles
+different requests concurrently and each request's events in order; an entry is
+acknowledged by its shard worker once handled.
+"""
 
 import asyncio
 import json
 import logging
-from typing import Any
+import socket
+import time
+from typing import Any, Dict, Optional
+
+from redis.exceptions import ResponseError
 
 from app.shared.redis_client import get_redis_async
+from app.userbot.dispatcher import EventDispatcher
 from app.userbot.results_sender import send_llm_insight_and_files, send_failure_insight_message
 from app.userbot.state import get_status_message
 from app.userbot.ui import update_manual_run_status_message
 
 logger = logging.getLogger("telegram_insight_agent.userbot.event_listener")
 
+_READ_COUNT = 100
+_READ_BLOCK_MS = 5000
+
 async def listen_for_job_events(client: Any, settings: Any) -> None:
     """
-    Listen for job progress and completion events on Redis Pub/Sub and handle them.
+    Consume job progress and completion events from the job events stream and handle them.
 
     Args:
         client: Telethon client.
@@ -23,36 +44,143 @@ async def listen_for_job_events(client: Any, settings: Any) -> None:
     Returns:
         None
     """
-    logger.info("Starting Redis pub/sub listener for job events.")
+    stream, group = settings.JOB_EVENTS_STREAM, settings.JOB_EVENTS_GROUP
+    consumer = settings.JOB_EVENTS_CONSUMER or socket.gethostname()
+    logger.info(f"Starting job events consumer {consumer} on stream={stream}, group={group}.")
     redis = get_redis_async()
-    pubsub = redis.pubsub()
+
+    async def handle(entry_id: str, fields: Dict[str, str]) -> bool:
+        return await _handle_entry(client, redis, stream, group, entry_id, fields)
+
+    dispatcher = EventDispatcher(
+        handle,
+        settings.EVENT_DISPATCH_SHARDS,
+        settings.EVENT_DISPATCH_QUEUE_SIZE,
+        lag_warn_sec=settings.EVENT_DISPATCH_LAG_WARN_SEC,
+    )
+    dispatcher.start()
     try:
-        await pubsub.psubscribe("request_status:*")
-        logger.info("Subscribed to Redis pubsub channel: request_status:*")
-        async for msg in pubsub.listen():
-            if msg["type"] == "pmessage":
-                try:
-                    data = json.loads(msg["data"])
-                    status = data.get("status")
-                    detail = data.get("detail")
-                    key = msg["channel"]
-                    request_id = key.split(":")[-1]
-                    logger.debug(f"Received job event: request_id={request_id}, status={status}")
-                    if status == "SUCCESS":
-                        await handle_insight_job_completion(client, request_id, detail, failed=False)
-                    elif status == "FAILED":
-                        await handle_insight_job_completion(client, request_id, detail, failed=True)
-                    elif status in ("TDL_HISTORY_EXPORT", "TDL_PARTICIPANTS_EXPORT", "CALLING_LLM"):
-                        await update_manual_run_status_message(client, request_id, status)
-                    elif status == "TDL_PARTICIPANTS_EXPORT_FAILED":
-                        await update_manual_run_status_message(client, request_id, "Participants export failed")
-                except Exception as e:
-                    logger.error(f"Error processing pubsub event: {e} - msg: {msg}")
-    except Exception as e:
-        logger.error(f"Error in Redis pub/sub listen loop: {e}")
+        await _consume(redis, settings, consumer, dispatcher)
     finally:
-        await pubsub.close()
-        await redis.close()
+        await dispatcher.close()
+
+async def _consume(redis: Any, settings: Any, consumer: str, dispatcher: EventDispatcher) -> None:
+    stream, group = settings.JOB_EVENTS_STREAM, settings.JOB_EVENTS_GROUP
+    # "0" first re-reads this consumer's unacknowledged events, then ">" reads new ones
+    read_id = "0"
+    next_claim = 0.0
+    while True:
+        try:
+            await _ensure_group(redis, stream, group)
+            if time.monotonic() >= next_claim:
+                await _claim_stale_events(redis, settings, consumer, dispatcher)
+                logger.info(f"Job event dispatch stats: {dispatcher.stats()}")
+                next_claim = time.monotonic() + settings.JOB_EVENTS_CLAIM_IDLE_SEC
+            response = await redis.xreadgroup(group, consumer, {stream: read_id}, count=_READ_COUNT, block=_READ_BLOCK_MS)
+            entries = response[0][1] if response else []
+            if read_id != ">":
+                if not entries:
+                    read_id = ">"
+                    continue
+                read_id = entries[-1][0]
+            for entry_id, fields in entries:
+                # Waits while the request's shard is full
+                await dispatcher.submit(entry_id, fields)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in job events consumer loop: {e}")
+            await asyncio.sleep(1)
+
+async def _ensure_group(redis: Any, stream: str, group: str) -> None:
+    try:
+        await redis.xgroup_create(stream, group, id="0", mkstream=True)
+        logger.info(f"Created consumer group {group} on stream {stream}")
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def _claim_stale_events(redis: Any, settings: Any, consumer: str, dispatcher: EventDispatcher) -> None:
+    """
+    Take over events another consumer read but did not acknowledge in time.
+
+    Events already delivered JOB_EVENTS_MAX_DELIVERIES times are acknowledged and dropped.
+    """
+    stream, group = settings.JOB_EVENTS_STREAM, settings.JOB_EVENTS_GROUP
+    idle_ms = int(settings.JOB_EVENTS_CLAIM_IDLE_SEC * 1000)
+    for pending in await redis.xpending_range(stream, group, "-", "+", _READ_COUNT, idle=idle_ms):
+        if pending["times_delivered"] >= settings.JOB_EVENTS_MAX_DELIVERIES:
+            await redis.xack(stream, group, pending["message_id"])
+            logger.warning(f"Dropped job event {pending['message_id']} after {pending['times_delivered']} deliveries")
+    result = await redis.xautoclaim(stream, group, consumer, idle_ms, "0-0", count=_READ_COUNT)
+    claimed = [(entry_id, fields) for entry_id, fields in result[1] if fields]
+    if claimed:
+        logger.info(f"Claimed {len(claimed)} stale job event(s)")
+    for entry_id, fields in claimed:
+        await dispatcher.submit(entry_id, fields)
+
+async def _handle_entry(client: Any, redis: Any, stream: str, group: str, entry_id: str, fields: Dict[str, str]) -> bool:
+    """
+    Handle one stream entry and acknowledge it; failures stay pending for a retry.
+
+    Returns:
+        True if the entry was handled and acknowledged.
+    """
+    try:
+        data = json.loads(fields["data"])
+        await handle_job_event(client, fields.get("request_id", ""), data.get("status"), data.get("detail"))
+    except Exception as e:
+        logger.error(f"Error processing job event {entry_id}: {e} - fields: {fields}")
+        return False
+    await redis.xack(stream, group, entry_id)
+    return True
+
+async def handle_job_event(client: Any, request_id: str, status: Optional[str], detail: Optional[Any]) -> None:
+    """
+    Route one job status event to the matching Telegram update.
+
+    Args:
+        client: Telethon client.
+        request_id: Job/request identifier.
+        status: Event status (SUCCESS, FAILED, PROGRESS, stage names, ...).
+        detail: Event detail, if any.
+
+    Returns:
+        None
+    """
+    logger.debug(f"Received job event: request_id={request_id}, status={status}")
+    if status == "SUCCESS":
+        await handle_insight_job_completion(client, request_id, detail, failed=False)
+    elif status == "FAILED":
+        await handle_insight_job_completion(client, request_id, detail, failed=True)
+    elif status in ("TDL_HISTORY_EXPORT", "TDL_PARTICIPANTS_EXPORT", "CALLING_LLM"):
+        await update_manual_run_status_message(client, request_id, status)
+    elif status == "PROGRESS":
+        await update_manual_run_status_message(client, request_id, format_progress(detail or {}))
+    elif status == "TDL_PARTICIPANTS_EXPORT_FAILED":
+        await update_manual_run_status_message(client, request_id, "Participants export failed")
+
+def format_progress(detail: dict) -> str:
+    """
+    Render a PROGRESS event detail as a short status line.
+
+    Args:
+        detail: Dict with `stage` and any of `done`, `total`, `percent`.
+
+    Returns:
+        e.g. "TDL_PARTICIPANTS_EXPORT: 123/456 (27.0%)" or "TDL_HISTORY_EXPORT: 1200 messages".
+    """
+    stage = detail.get("stage", "")
+    done, total, percent = detail.get("done"), detail.get("total"), detail.get("percent")
+    if done is not None and total:
+        text = f"{done}/{total}"
+    elif done is not None:
+        text = f"{done} messages" if stage == "TDL_HISTORY_EXPORT" else str(done)
+    else:
+        text = ""
+    if percent is not None:
+        text = f"{text} ({percent:.1f}%)" if text else f"{percent:.1f}%"
+    return f"{stage}: {text}" if text else stage
 
 async def handle_insight_job_completion(client: Any, request_id: str, detail: dict, failed: bool = False) -> None:
     """
@@ -86,6 +214,9 @@ async def handle_insight_job_completion(client: Any, request_id: str, detail: di
             logger.info("Sent LLM insight and files.")
     except Exception as e:
         logger.error(f"Error handling job completion: {e}")
+    # Requests that attached to this run (see app.worker.coalescing) share its result
+    for attached_id in detail.get("attached_request_ids") or []:
+        await update_manual_run_status_message(client, attached_id, "FAILED" if failed else "SUCCESS (results sent above)")
 
 # --- Pytest skeleton ---
 
@@ -94,6 +225,20 @@ import pytest
 from unittest.mock import AsyncMock, patch
 from app.userbot import event_listener
 
+@pytest.mark.asyncio
+async def test_entry_is_acked_only_after_handling(monkeypatch):
+    redis = AsyncMock()
+    monkeypatch.setattr(event_listener, "handle_job_event", AsyncMock(side_effect=RuntimeError("boom")))
+    await event_listener._handle_entry(None, redis, "s", "g", "1-0", {"request_id": "r", "data": '{"status": "SUCCESS"}'})
+    redis.xack.assert_not_awaited()
+    monkeypatch.setattr(event_listener, "handle_job_event", AsyncMock())
+    await event_listener._handle_entry(None, redis, "s", "g", "1-0", {"request_id": "r", "data": '{"status": "SUCCESS"}'})
+    redis.xack.assert_awaited_once_with("s", "g", "1-0")
+
+def test_format_progress():
+    assert event_listener.format_progress({"stage": "TDL_HISTORY_EXPORT", "done": 1200}) == "TDL_HISTORY_EXPORT: 1200 messages"
+    assert event_listener.format_progress({"stage": "S", "done": 1, "total": 4, "percent": 25.0}) == "S: 1/4 (25.0%)"
+
 @pytest.mark.asyncio
 async def test_handle_insight_job_completion_success(monkeypatch):
     client = AsyncMock()
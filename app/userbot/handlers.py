@@ -3,11 +3,14 @@
 from app.shared.database import async_sessionmaker
 from app.shared.db_crud import (
     add_monitored_chat, get_all_monitored_chats_for_user, remove_monitored_chat, update_monitored_chat_prompt,
-    set_chat_active, get_latest_run_status, set_default_prompt, get_default_prompt
+    set_chat_active, get_latest_run_status, set_default_prompt, get_default_prompt, reset_last_processed_message_id,
+    set_dedup_threshold, set_schedule_interval
 )
 from app.userbot.ui import format_monitored_chats_list
+from config import settings
 from app.shared.db_crud import get_monitored_chat
-from app.worker.tasks import process_monitored_chat
+from app.worker.tasks import process_monitored_chat, monitoring_job_timeout
+from app.worker.dedup import MAX_DISTANCE
 import asyncio
 
 import logging
@@ -496,6 +499,82 @@ async def handle_monitor_prompt(event):
     except Exception as e:
         await event.reply(f"Failed to update prompt: {e}")
 
+async def handle_monitor_reset(event):
+    """Usage: /monitor reset <chat_id> -- next run re-exports the full history"""
+    try:
+        parts = event.raw_text.split()
+        if len(parts) < 3:
+            await event.reply("Usage: /monitor reset <chat_id>")
+            return
+        _, _, chat_id_raw = parts
+        entity = await event.client.get_entity(chat_id_raw)
+        chat_id = entity.id
+        user_id = event.sender_id
+        async with async_sessionmaker() as session:
+            rc = await reset_last_processed_message_id(session, user_id, chat_id)
+            if rc:
+                await event.reply(f"Reset progress for chat {chat_id}. Next run will export the full history.")
+            else:
+                await event.reply(f"No such monitored chat to reset.")
+    except Exception as e:
+        await event.reply(f"Failed to reset monitoring: {e}")
+
+async def handle_monitor_dedup(event):
+    """Usage: /monitor dedup <chat_id> <bits|default|off> -- near-duplicate collapsing threshold"""
+    try:
+        parts = event.raw_text.split()
+        if len(parts) < 4:
+            await event.reply(f"Usage: /monitor dedup <chat_id> <bits 0-{MAX_DISTANCE}|default|off>")
+            return
+        _, _, chat_id_raw, value = parts[:4]
+        if value == "default":
+            threshold = None
+        elif value == "off":
+            threshold = -1
+        elif value.isdigit() and int(value) <= MAX_DISTANCE:
+            threshold = int(value)
+        else:
+            await event.reply(f"Threshold must be a number of bits from 0 to {MAX_DISTANCE}, 'default' or 'off'.")
+            return
+        entity = await event.client.get_entity(chat_id_raw)
+        chat_id = entity.id
+        user_id = event.sender_id
+        async with async_sessionmaker() as session:
+            rc = await set_dedup_threshold(session, user_id, chat_id, threshold)
+            if rc:
+                await event.reply(f"Near-duplicate threshold for chat {chat_id} set to {value}.")
+            else:
+                await event.reply(f"No such monitored chat.")
+    except Exception as e:
+        await event.reply(f"Failed to set dedup threshold: {e}")
+
+async def handle_monitor_interval(event):
+    """Usage: /monitor interval <chat_id> <minutes|default> -- how often the chat is summarized"""
+    try:
+        parts = event.raw_text.split()
+        if len(parts) < 4:
+            await event.reply("Usage: /monitor interval <chat_id> <minutes|default>")
+            return
+        _, _, chat_id_raw, value = parts[:4]
+        if value == "default":
+            interval_sec = None
+        elif value.isdigit() and int(value) * 60 >= settings.SCHEDULE_MIN_INTERVAL_SEC:
+            interval_sec = int(value) * 60
+        else:
+            await event.reply(f"Interval must be at least {settings.SCHEDULE_MIN_INTERVAL_SEC // 60} minutes, or 'default'.")
+            return
+        entity = await event.client.get_entity(chat_id_raw)
+        chat_id = entity.id
+        user_id = event.sender_id
+        async with async_sessionmaker() as session:
+            rc = await set_schedule_interval(session, user_id, chat_id, interval_sec)
+            if rc:
+                await event.reply(f"Run interval for chat {chat_id} set to {value}.")
+            else:
+                await event.reply(f"No such monitored chat.")
+    except Exception as e:
+        await event.reply(f"Failed to set run interval: {e}")
+
 async def handle_monitor_run(event):
     """Usage: /monitor run <chat_id>"""
     try:
@@ -512,14 +591,33 @@ async def handle_monitor_run(event):
             if mc is None:
                 await event.reply("No monitored chat found.")
                 return
-        # Enqueue the job (sync RQ call)
+        # Enqueue the job (sync RQ call), unless a run for this chat is already in flight
         from app.shared.redis_client import get_rq_queue
-        rq_queue = get_rq_queue()
+        from app.worker.coalescing import chat_job_id, claim_chat_run, release_chat_run
+        from app.worker.lanes import promote_to_high_priority, queue_for_run
+        rq_queue = get_rq_queue(queue_for_run(is_manual_run=True))
         import uuid
         request_id = str(uuid.uuid4())
         from app.userbot.state import store_status_message
+        # Store the status message before claiming: once attached, the run may finish
+        # (and look up this request's status message) at any moment
         msg = await event.reply("Manual run triggered. Awaiting results...")
         await store_status_message(request_id, msg.id)
-        rq_queue.enqueue("app.worker.tasks.process_monitored_chat", mc.id, request_id, True)
+        if not claim_chat_run(mc.id, request_id):
+            # A scheduled run still waiting in the low lane now serves a manual request
+            try:
+                promote_to_high_priority(chat_job_id(mc.id))
+            except Exception as e:
+                logger.warning(f"Could not move queued run for monitored_chat_id={mc.id} to the high lane: {e}")
+            await msg.edit("A run for this chat is already in progress. Its results will be sent to you.")
+            return
+        try:
+            rq_queue.enqueue(
+                "app.worker.tasks.process_monitored_chat", mc.id, request_id, True,
+                job_id=chat_job_id(mc.id), job_timeout=monitoring_job_timeout(),
+            )
+        except Exception:
+            release_chat_run(mc.id)
+            raise
     except Exception as e:
         await event.reply(f"Failed to start manual run: {e}")
\ No newline at end of file
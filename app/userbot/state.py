@@ -1,37 +1,67 @@
 # For managing temporary state (multi-step commands) via Redis
 
 import logging
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 from app.shared.redis_client import get_redis_async
+from config import settings
 
 logger = logging.getLogger("telegram_insight_agent.userbot.state")
 
+# Write-through cache of request_id -> status message_id. The userbot creates these
+# mappings itself, so lookups while handling a job's events are usually served here;
+# Redis (with the same TTL) covers restarts and other userbot replicas.
+_status_messages: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+
+def _get_local_status_message(request_id: str) -> Optional[int]:
+    entry = _status_messages.get(request_id)
+    if entry is None:
+        return None
+    expires_at, message_id = entry
+    if expires_at < time.monotonic():
+        del _status_messages[request_id]
+        return None
+    _status_messages.move_to_end(request_id)
+    return message_id
+
+def _set_local_status_message(request_id: str, message_id: int) -> None:
+    _status_messages[request_id] = (time.monotonic() + settings.STATUS_MSG_TTL_SEC, message_id)
+    _status_messages.move_to_end(request_id)
+    while len(_status_messages) > settings.STATUS_MSG_LOCAL_MAX_ENTRIES:
+        _status_messages.popitem(last=False)
+
 async def store_status_message(request_id: str, message_id: int) -> None:
     """
-    Store the Telegram message_id associated with a request_id in Redis.
+    Store the Telegram message_id associated with a request_id in Redis (expiring
+    after STATUS_MSG_TTL_SEC) and in the local cache.
     """
     logger.debug(f"Storing status message: request_id={request_id}, message_id={message_id}")
     redis = get_redis_async()
     try:
-        await redis.set(f"status_msg:{request_id}", message_id)
+        await redis.set(f"status_msg:{request_id}", message_id, ex=settings.STATUS_MSG_TTL_SEC)
+        _set_local_status_message(request_id, message_id)
         logger.info(f"Stored status message for request_id={request_id}")
     except Exception as e:
         logger.error(f"Error storing status message: {e}")
         raise
-    finally:
-        await redis.close()
 
 async def get_status_message(request_id: str) -> Optional[int]:
     """
-    Retrieve the Telegram message_id for the given request_id from Redis.
+    Retrieve the Telegram message_id for the given request_id, from the local cache
+    or else from Redis.
     """
     logger.debug(f"Getting status message for request_id={request_id}")
+    msg_id = _get_local_status_message(request_id)
+    if msg_id is not None:
+        return msg_id
     redis = get_redis_async()
     try:
         val = await redis.get(f"status_msg:{request_id}")
         if val is not None:
             try:
                 msg_id = int(val)
+                _set_local_status_message(request_id, msg_id)
                 logger.info(f"Retrieved status message: request_id={request_id}, message_id={msg_id}")
                 return msg_id
             except Exception as e:
@@ -42,22 +72,37 @@ async def get_status_message(request_id: str) -> Optional[int]:
     except Exception as e:
         logger.error(f"Error getting status message: {e}")
         return None
-    finally:
-        await redis.close()
 
 # --- Pytest skeleton ---
 
 """
 import pytest
+from unittest.mock import AsyncMock
+from app.userbot import state
 from app.userbot.state import store_status_message, get_status_message
 
 @pytest.mark.asyncio
 async def test_store_status_message(monkeypatch):
-    # monkeypatch get_redis_async().set to track calls
-    pass
+    redis = AsyncMock()
+    monkeypatch.setattr(state, "get_redis_async", lambda: redis)
+    await store_status_message("r1", 5)
+    redis.set.assert_awaited_once_with("status_msg:r1", 5, ex=state.settings.STATUS_MSG_TTL_SEC)
+
+@pytest.mark.asyncio
+async def test_get_status_message_is_served_locally_after_store(monkeypatch):
+    redis = AsyncMock()
+    monkeypatch.setattr(state, "get_redis_async", lambda: redis)
+    await store_status_message("r2", 7)
+    assert await get_status_message("r2") == 7
+    redis.get.assert_not_awaited()
 
 @pytest.mark.asyncio
-async def test_get_status_message(monkeypatch):
-    # monkeypatch get_redis_async().get to return a value
-    pass
+async def test_get_status_message_falls_back_to_redis(monkeypatch):
+    redis = AsyncMock()
+    redis.get.return_value = "9"
+    monkeypatch.setattr(state, "get_redis_async", lambda: redis)
+    state._status_messages.clear()
+    assert await get_status_message("r3") == 9
+    assert await get_status_message("r3") == 9
+    redis.get.assert_awaited_once()
 """
\ No newline at end of file
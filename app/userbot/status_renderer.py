@@ -0,0 +1,183 @@
+# Debounced rendering of manual-run status messages
+
+"""
+Coalesce status-message edits so the userbot stays under Telegram's flood limits.
+
+Status updates only record the latest text per request; a background task edits
+the messages at most once per STATUS_FLUSH_INTERVAL_SEC, spacing consecutive edits
+by STATUS_EDIT_GAP_SEC. Intermediate statuses that were overtaken before a flush
+are never sent, and an edit that would show the text already on screen is skipped.
+A FloodWait on any edit pauses all edits for the time Telegram asks for; the
+statuses still pending are kept (newer ones win) and sent when it expires.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from telethon.errors import FloodWaitError, MessageNotModifiedError
+
+from app.userbot.state import get_status_message
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.userbot.status_renderer")
+
+# Last rendered text is remembered for this many requests (oldest forgotten first)
+_MAX_TRACKED_REQUESTS = 10000
+
+class StatusRenderer:
+    """
+    Keeps the latest status per request and flushes them as message edits.
+    """
+
+    def __init__(self, client: Any, flush_interval_sec: float, edit_gap_sec: float = 0.0) -> None:
+        self.client = client
+        self.flush_interval_sec = flush_interval_sec
+        self.edit_gap_sec = edit_gap_sec
+        self._latest: Dict[str, str] = {}
+        self._shown: "OrderedDict[str, str]" = OrderedDict()
+        self._blocked_until = 0.0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.metrics: Dict[str, int] = {"updates": 0, "edits": 0, "skipped": 0, "flood_waits": 0, "errors": 0}
+
+    def update(self, request_id: str, status: str) -> None:
+        """
+        Record a request's latest status; it is shown on the next flush.
+        """
+        self.metrics["updates"] += 1
+        self._latest[request_id] = status
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self) -> None:
+        """
+        Flush pending statuses whenever there are some, at most once per flush interval.
+        """
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            delay = self._blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Status flush failed: {e}")
+            await asyncio.sleep(self.flush_interval_sec)
+
+    async def close(self) -> None:
+        """
+        Stop the flush task; statuses not yet shown are dropped.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def flush(self) -> None:
+        """
+        Edit the status message of every request with a pending status.
+        """
+        pending, self._latest = self._latest, {}
+        for request_id, status in pending.items():
+            if time.monotonic() < self._blocked_until:
+                # Keep it for after the FloodWait, unless a newer status arrived meanwhile
+                self._latest.setdefault(request_id, status)
+                continue
+            if self._shown.get(request_id) == status:
+                self.metrics["skipped"] += 1
+                continue
+            await self._edit(request_id, status)
+        if self._latest:
+            self._wake.set()
+
+    async def _edit(self, request_id: str, status: str) -> None:
+        msg_id = await get_status_message(request_id)
+        if not msg_id:
+            logger.warning(f"No status message found for request_id={request_id}")
+            return
+        try:
+            await self.client.edit_message("me", msg_id, f"Status: {status}")
+        except FloodWaitError as e:
+            self.metrics["flood_waits"] += 1
+            self._blocked_until = time.monotonic() + e.seconds
+            self._latest.setdefault(request_id, status)
+            logger.warning(f"FloodWait on status edit; pausing status edits for {e.seconds}s")
+            return
+        except MessageNotModifiedError:
+            pass
+        except Exception as e:
+            self.metrics["errors"] += 1
+            logger.error(f"Failed to update status message for request_id={request_id}: {e}")
+            return
+        else:
+            self.metrics["edits"] += 1
+            logger.info(f"Status message updated for request_id={request_id}")
+        self._shown[request_id] = status
+        self._shown.move_to_end(request_id)
+        while len(self._shown) > _MAX_TRACKED_REQUESTS:
+            self._shown.popitem(last=False)
+        if self.edit_gap_sec:
+            await asyncio.sleep(self.edit_gap_sec)
+
+_renderer: Optional[StatusRenderer] = None
+
+def get_status_renderer(client: Any) -> StatusRenderer:
+    """
+    The process-wide status renderer (created on first use).
+    """
+    global _renderer
+    if _renderer is None or _renderer.client is not client:
+        _renderer = StatusRenderer(client, settings.STATUS_FLUSH_INTERVAL_SEC, settings.STATUS_EDIT_GAP_SEC)
+    return _renderer
+
+# --- Pytest skeleton ---
+
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock
+from telethon.errors import FloodWaitError
+from app.userbot import status_renderer
+from app.userbot.status_renderer import StatusRenderer
+
+@pytest.mark.asyncio
+async def test_only_latest_status_is_rendered(monkeypatch):
+    monkeypatch.setattr(status_renderer, "get_status_message", AsyncMock(return_value=42))
+    client = AsyncMock()
+    renderer = StatusRenderer(client, flush_interval_sec=60)
+    renderer._latest = {"r": "CALLING_LLM"}
+    renderer._latest["r"] = "PROGRESS 2"
+    await renderer.flush()
+    client.edit_message.assert_awaited_once_with("me", 42, "Status: PROGRESS 2")
+
+@pytest.mark.asyncio
+async def test_noop_edit_is_skipped(monkeypatch):
+    monkeypatch.setattr(status_renderer, "get_status_message", AsyncMock(return_value=42))
+    client = AsyncMock()
+    renderer = StatusRenderer(client, flush_interval_sec=60)
+    for _ in range(2):
+        renderer._latest["r"] = "CALLING_LLM"
+        await renderer.flush()
+    assert client.edit_message.await_count == 1
+    assert renderer.metrics["skipped"] == 1
+
+@pytest.mark.asyncio
+async def test_flood_wait_pauses_edits(monkeypatch):
+    monkeypatch.setattr(status_renderer, "get_status_message", AsyncMock(return_value=42))
+    client = AsyncMock()
+    client.edit_message.side_effect = [FloodWaitError(request=None, capture=5), None]
+    renderer = StatusRenderer(client, flush_interval_sec=60)
+    renderer._latest = {"a": "CALLING_LLM", "b": "PROGRESS 2"}
+    before = time.monotonic()
+    await renderer.flush()
+    assert client.edit_message.await_count == 1
+    assert renderer._latest == {"a": "CALLING_LLM", "b": "PROGRESS 2"}
+    assert 4.9 <= renderer._blocked_until - before <= 5.5
+    assert renderer.metrics["flood_waits"] == 1
+"""
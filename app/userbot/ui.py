@@ -62,7 +62,10 @@ def test_build_settings_keyboard_success(monkeypatch):
 
 async def update_manual_run_status_message(client: Any, request_id: str, status: str) -> None:
     """
-    Edit the Telegram status message associated with a request_id to show progress.
+    Show a new status on the Telegram status message associated with a request_id.
+
+    The edit is debounced by the status renderer (app.userbot.status_renderer): only
+    the latest status per request is sent, on its next flush.
 
     Args:
         client: Telethon client.
@@ -72,17 +75,9 @@ async def update_manual_run_status_message(client: Any, request_id: str, status:
     Returns:
         None
     """
-    from app.userbot.state import get_status_message
-    logger.info(f"Updating status message for request_id={request_id} to status={status}")
-    msg_id = await get_status_message(request_id)
-    if not msg_id:
-        logger.warning(f"No status message found for request_id={request_id}")
-        return
-    try:
-        await client.edit_message("me", msg_id, f"Status: {status}")
-        logger.info(f"Status message updated for request_id={request_id}")
-    except Exception as e:
-        logger.error(f"Failed to update status message: {e}")
+    from app.userbot.status_renderer import get_status_renderer
+    logger.debug(f"Queueing status for request_id={request_id}: {status}")
+    get_status_renderer(client).update(request_id, status)
 
 # --- Pytest skeleton ---
 
@@ -101,5 +96,5 @@ def test_format_monitored_chats_list_some():
     out = format_monitored_chats_list(chats)
     assert "A" in out and "B" in out and "123" in out and "456" in out
 
-# For update_manual_run_status_message, use Telethon client mock and patch get_status_message
+# For update_manual_run_status_message, see the status_renderer tests (it only queues the status)
 """
\ No newline at end of file
@@ -0,0 +1,306 @@
+# Asyncio-native consumer for RQ monitoring jobs
+
+"""
+Run many monitoring pipelines concurrently in one process.
+
+The pipeline is I/O-bound (tdl subprocesses, LLM HTTP calls, Redis), so instead of one
+job per RQ worker this consumer takes jobs off the same RQ queues, in the same
+priority order, and runs up to ASYNC_CONSUMER_CONCURRENCY `_process` coroutines at
+once on the warm WorkerRuntime loop. Jobs are enqueued exactly as before and publish
+the same status events; their RQ status is updated (started, finished, failed) and
+failures are added to the queue's FailedJobRegistry. Nothing blocks the shared loop: the
+pipeline publishes its events and releases its lease with the async Redis client, and
+the synchronous RQ calls run in threads.
+
+A dequeued job id is moved atomically into `rq:async:processing:<consumer name>` and
+removed when the job ends. Each consumer keeps `rq:async:heartbeat:<consumer name>`
+alive (TTL ASYNC_CONSUMER_HEARTBEAT_TTL_SEC, refreshed every third of it); ids left in
+the processing list of a consumer whose heartbeat has expired are put back on their
+queue by any running consumer, and a consumer requeues its own list when it starts. On
+SIGTERM/SIGINT the consumer stops taking jobs and waits up to
+ASYNC_CONSUMER_DRAIN_TIMEOUT_SEC for the in-flight ones.
+"""
+
+import asyncio
+import inspect
+import logging
+import signal
+import socket
+import time
+import traceback
+from typing import Dict, List, Optional, Set
+
+from rq.job import Job, JobStatus
+from rq.registry import FailedJobRegistry, FinishedJobRegistry
+from rq.utils import now
+
+from app.shared.redis_client import get_redis_async, get_redis_sync, get_rq_queue
+from app.worker.lanes import record_queue_wait
+from app.worker import tasks
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.worker.async_consumer")
+
+QUEUE_KEY_PREFIX = "rq:queue:"
+PROCESSING_KEY_PREFIX = "rq:async:processing:"
+HEARTBEAT_KEY_PREFIX = "rq:async:heartbeat:"
+_IDLE_POLL_SEC = 0.25
+_END_JOB_ATTEMPTS = 3
+_END_JOB_RETRY_SEC = 1.0
+
+# KEYS: processing list, then queue lists in priority order.
+# Moves the first available job id into the processing list; returns {queue key, job id}.
+_DEQUEUE_LUA = """
+for i = 2, #KEYS do
+    local job_id = redis.call('LMOVE', KEYS[i], KEYS[1], 'LEFT', 'RIGHT')
+    if job_id then
+        return {KEYS[i], job_id}
+    end
+end
+return false
+"""
+
+# KEYS: processing list, queue list. ARGV: job id.
+# Puts the job back on the queue if it is still in the processing list (so only once).
+_REQUEUE_LUA = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) > 0 then
+    redis.call('LPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+class AsyncJobConsumer:
+    """
+    Pulls RQ jobs for app.worker.tasks and runs them as concurrent coroutines.
+    """
+
+    def __init__(self, queues: List[str], concurrency: int, name: Optional[str] = None) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.queues = queues
+        self.concurrency = concurrency
+        self.name = name or socket.gethostname()
+        self.processing_key = f"{PROCESSING_KEY_PREFIX}{self.name}"
+        self.heartbeat_key = f"{HEARTBEAT_KEY_PREFIX}{self.name}"
+        self._queue_keys = [f"{QUEUE_KEY_PREFIX}{q}" for q in queues]
+        self._stopping = asyncio.Event()
+        self._in_flight: Set[asyncio.Task] = set()
+        self.metrics: Dict[str, int] = {"started": 0, "finished": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def stop(self) -> None:
+        """
+        Stop taking new jobs; in-flight jobs are drained by run().
+        """
+        if not self._stopping.is_set():
+            logger.info(f"Consumer {self.name} stopping; draining {len(self._in_flight)} in-flight job(s)")
+        self._stopping.set()
+
+    async def _requeue_stranded(self, processing_key: str) -> int:
+        # Jobs a consumer dequeued into processing_key but never finished
+        redis = get_redis_async()
+        script = redis.register_script(_REQUEUE_LUA)
+        requeued = 0
+        # Oldest last, so after the LPUSHes they are back at the head in their original order
+        for job_id in reversed(await redis.lrange(processing_key, 0, -1)):
+            try:
+                origin = (await asyncio.to_thread(Job.fetch, job_id, connection=get_redis_sync())).origin
+            except Exception as e:
+                logger.warning(f"Dropping stranded job {job_id}: {e}")
+                await redis.lrem(processing_key, 1, job_id)
+                continue
+            if await script(keys=[processing_key, f"{QUEUE_KEY_PREFIX}{origin}"], args=[job_id]):
+                requeued += 1
+                logger.warning(f"Requeued stranded job {job_id} from {processing_key} on queue={origin}")
+        return requeued
+
+    async def _recover_dead_consumers(self) -> None:
+        # Processing lists of consumers (e.g. on a since-renamed host) whose heartbeat expired
+        redis = get_redis_async()
+        async for processing_key in redis.scan_iter(match=f"{PROCESSING_KEY_PREFIX}*"):
+            name = processing_key[len(PROCESSING_KEY_PREFIX):]
+            if name == self.name or await redis.exists(f"{HEARTBEAT_KEY_PREFIX}{name}"):
+                continue
+            logger.warning(f"Consumer {name} has no heartbeat; requeueing its jobs")
+            await self._requeue_stranded(processing_key)
+
+    async def _beat(self) -> None:
+        ttl_ms = int(settings.ASYNC_CONSUMER_HEARTBEAT_TTL_SEC * 1000)
+        await get_redis_async().set(self.heartbeat_key, int(time.time()), px=ttl_ms)
+
+    async def _heartbeat(self) -> None:
+        interval = max(settings.ASYNC_CONSUMER_HEARTBEAT_TTL_SEC / 3, 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._beat()
+                await self._recover_dead_consumers()
+            except Exception as e:
+                logger.warning(f"Consumer {self.name} heartbeat failed: {e}")
+
+    async def _dequeue(self) -> Optional[str]:
+        redis = get_redis_async()
+        script = redis.register_script(_DEQUEUE_LUA)
+        result = await script(keys=[self.processing_key, *self._queue_keys])
+        return result[1] if result else None
+
+    def _start_job(self, job_id: str) -> Job:
+        job = Job.fetch(job_id, connection=get_redis_sync())
+        job.started_at = now()
+        job.set_status(JobStatus.STARTED)
+        return job
+
+    def _end_job(self, job: Job, error: Optional[str]) -> None:
+        queue = get_rq_queue(job.origin)
+        job.ended_at = now()
+        with queue.connection.pipeline() as pipe:
+            if error is None:
+                job.set_status(JobStatus.FINISHED, pipeline=pipe)
+                FinishedJobRegistry(queue=queue).add(job, ttl=job.get_result_ttl(), pipeline=pipe)
+            else:
+                job.set_status(JobStatus.FAILED, pipeline=pipe)
+                FailedJobRegistry(queue=queue).add(job, ttl=job.failure_ttl, exc_string=error, pipeline=pipe)
+            job.save(pipeline=pipe, include_meta=False, include_result=False)
+            pipe.lrem(self.processing_key, 1, job.id)
+            pipe.execute()
+
+    async def _record_end(self, job: Job, error: Optional[str]) -> None:
+        # The job has run: retry recording it, and never leave it in the processing list,
+        # where recovery would run the pipeline (summary, watermark) a second time
+        for attempt in range(1, _END_JOB_ATTEMPTS + 1):
+            try:
+                await asyncio.to_thread(self._end_job, job, error)
+                return
+            except Exception as e:
+                logger.warning(f"Recording the end of job {job.id} failed (attempt {attempt}/{_END_JOB_ATTEMPTS}): {e}")
+                if attempt < _END_JOB_ATTEMPTS:
+                    await asyncio.sleep(_END_JOB_RETRY_SEC * attempt)
+        logger.error(f"Job {job.id} ran but its end could not be recorded; it stays unfinished in RQ and is not re-run")
+        try:
+            await get_redis_async().lrem(self.processing_key, 1, job.id)
+        except Exception as e:
+            logger.error(f"Could not remove job {job.id} from {self.processing_key}; recovery will run it again: {e}")
+
+    async def _execute(self, job: Job) -> None:
+        if job.func_name != tasks.PROCESS_MONITORED_CHAT_FUNC:
+            # Anything else keeps its synchronous semantics, off the event loop
+            await asyncio.to_thread(job.func, *job.args, **job.kwargs)
+            return
+        bound = inspect.signature(tasks.process_monitored_chat).bind(*job.args, **job.kwargs)
+        bound.apply_defaults()
+        queue_stats = await asyncio.to_thread(record_queue_wait, job)
+        # The job timeout RQ's work horse would enforce (None/-1: no limit)
+        timeout = job.timeout if job.timeout and job.timeout > 0 else None
+        await asyncio.wait_for(
+            tasks._process(
+                bound.arguments["monitored_chat_db_id"],
+                bound.arguments["request_id"],
+                bound.arguments["is_manual_run"],
+                queue_stats,
+            ),
+            timeout=timeout,
+        )
+
+    async def _run_job(self, job_id: str, slots: asyncio.Semaphore) -> None:
+        job = None
+        try:
+            job = await asyncio.to_thread(self._start_job, job_id)
+            self.metrics["started"] += 1
+            logger.info(f"Consumer {self.name} started job {job_id} ({job.func_name})")
+            error = None
+            try:
+                await self._execute(job)
+            except Exception:
+                error = traceback.format_exc()
+                logger.error(f"Job {job_id} failed: {error}")
+            await self._record_end(job, error)
+            self.metrics["failed" if error else "finished"] += 1
+        except asyncio.CancelledError:
+            # Left in the processing list: requeued by another consumer or on restart
+            logger.warning(f"Job {job_id} cancelled during drain")
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} could not be run: {e}")
+            if job is None:
+                await get_redis_async().lrem(self.processing_key, 1, job_id)
+        finally:
+            slots.release()
+            self.metrics["in_flight"] -= 1
+
+    async def run(self) -> None:
+        """
+        Consume jobs until stop() is called, then drain in-flight jobs.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+        logger.info(f"Async consumer {self.name} started (queues: {', '.join(self.queues)}, concurrency={self.concurrency})")
+        await self._beat()
+        await self._requeue_stranded(self.processing_key)
+        await self._recover_dead_consumers()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        slots = asyncio.Semaphore(self.concurrency)
+        while not self._stopping.is_set():
+            await slots.acquire()
+            if self._stopping.is_set():
+                slots.release()
+                break
+            try:
+                job_id = await self._dequeue()
+            except Exception as e:
+                slots.release()
+                logger.error(f"Dequeue failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if job_id is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=_IDLE_POLL_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.metrics["in_flight"] += 1
+            self.metrics["max_in_flight"] = max(self.metrics["max_in_flight"], self.metrics["in_flight"])
+            task = asyncio.create_task(self._run_job(job_id, slots))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+        if self._in_flight:
+            _, pending = await asyncio.wait(set(self._in_flight), timeout=settings.ASYNC_CONSUMER_DRAIN_TIMEOUT_SEC)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.warning(f"Cancelled {len(pending)} job(s) still running after the drain timeout")
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        try:
+            # Jobs cancelled above are then requeued by the other consumers right away
+            await get_redis_async().delete(self.heartbeat_key)
+        except Exception as e:
+            logger.warning(f"Could not remove heartbeat of consumer {self.name}: {e}")
+        logger.info(f"Async consumer {self.name} stopped: {self.metrics}")
+
+# --- Pytest skeleton ---
+
+"""
+import pytest
+from app.worker.async_consumer import AsyncJobConsumer
+
+def test_rejects_zero_concurrency():
+    with pytest.raises(ValueError):
+        AsyncJobConsumer(["high"], concurrency=0)
+
+@pytest.mark.asyncio
+async def test_runs_jobs_concurrently(monkeypatch):
+    # Patch _dequeue to hand out ids "a".."e" then None, _start_job/_end_job to no-ops and
+    # _execute to sleep 0.1s; with concurrency=5 all five finish in about 0.1s, and
+    # metrics["max_in_flight"] == 5.
+    pass
+
+@pytest.mark.asyncio
+async def test_requeues_jobs_of_consumer_without_heartbeat(redis_server):
+    # Needs a Redis server: a processing list whose consumer has no heartbeat key is moved
+    # back to its queue once, even with two consumers recovering it at the same time, and
+    # the list of a consumer with a live heartbeat is left alone.
+    pass
+"""
@@ -0,0 +1,73 @@
+# Process pool for multi-core cleaning of large exports
+
+"""
+Lazily created, per-process ProcessPoolExecutor used to clean very large exports.
+
+The pool uses the "spawn" start method: it is created from a worker thread of a
+process that also holds an event loop, DB and Redis pools, none of which should be
+inherited by a forked child. A spawned child re-imports the parent's main module
+(run_worker.py, and with it the whole worker stack, though it opens no connections
+until used), so starting the pool takes a few seconds; it is therefore kept for the
+life of the worker process rather than created per export.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.clean_pool")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+def clean_pool_workers() -> int:
+    """
+    Number of cleaning processes: CLEAN_PARALLEL_WORKERS, or all cores but one if 0.
+    """
+    if settings.CLEAN_PARALLEL_WORKERS > 0:
+        return settings.CLEAN_PARALLEL_WORKERS
+    return max(1, (os.cpu_count() or 2) - 1)
+
+def get_clean_pool() -> ProcessPoolExecutor:
+    """
+    Return this process's cleaning pool, creating it on first use.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            workers = clean_pool_workers()
+            logger.info(f"Starting cleaning process pool with {workers} worker(s)")
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+def shutdown_clean_pool() -> None:
+    """
+    Stop the cleaning pool if this process started one (call on shutdown).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=True, cancel_futures=True)
+            logger.info("Cleaning process pool stopped")
+        _pool = None
+
+# --- Pytest skeleton ---
+
+"""
+from app.worker.clean_pool import get_clean_pool, shutdown_clean_pool
+from app.worker.text_cleaner import clean_history_batch
+
+def test_pool_runs_clean_history_batch():
+    pool = get_clean_pool()
+    assert pool is get_clean_pool()
+    batch = pool.submit(clean_history_batch, [{"id": 1, "text": "hello there"}]).result()
+    assert (batch["count"], batch["max_message_id"]) == (1, 1)
+    shutdown_clean_pool()
+"""
@@ -0,0 +1,231 @@
+# Per-chat in-flight run coalescing
+
+"""
+At most one pipeline run per monitored chat, cluster-wide.
+
+A run is represented by a Redis lease `inflight:chat:<id>` holding the owner's token
+(the request_id, or "scheduled"). Whoever enqueues a run first sets the lease with a
+long "queued" expiry and enqueues the job under the chat's deterministic job id; a
+request that finds the lease taken is added to the `inflight:chat:<id>:waiters` set
+instead of enqueueing. The worker takes over the lease when the job starts and keeps
+renewing it with a short expiry, so a crashed worker frees the chat quickly. On its
+terminal status the worker releases the lease and reports the waiters, which share
+the run's result.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List, Optional
+
+from app.shared.redis_client import get_redis_async, get_redis_sync
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.coalescing")
+
+KEY_PREFIX = "inflight:chat:"
+SCHEDULED_TOKEN = "scheduled"
+
+# KEYS: lease, waiters. ARGV: token, queued lease ms.
+# Returns 1 if the caller owns the new run, 0 if it was attached to the one in flight.
+_CLAIM_LUA = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+if ARGV[1] ~= 'scheduled' then
+    redis.call('SADD', KEYS[2], ARGV[1])
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+end
+return 0
+"""
+
+# KEYS: lease, waiters. ARGV: token, lease ms.
+# Returns 1 if the job may run (the lease was its own or had expired), else attaches it.
+_START_LUA = """
+local owner = redis.call('GET', KEYS[1])
+if not owner or owner == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+if ARGV[1] ~= 'scheduled' then
+    redis.call('SADD', KEYS[2], ARGV[1])
+    redis.call('PEXPIRE', KEYS[2], math.max(redis.call('PTTL', KEYS[1]), tonumber(ARGV[2])))
+end
+return 0
+"""
+
+# KEYS: lease, waiters. ARGV: token, lease ms. Returns 0 if the lease was lost.
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+# KEYS: lease, waiters. ARGV: token. Returns the waiters of the caller's run.
+_FINISH_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+local waiters = redis.call('SMEMBERS', KEYS[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+return waiters
+"""
+
+def chat_job_id(monitored_chat_id: int) -> str:
+    """
+    Deterministic RQ job id for a monitored chat's pipeline run.
+    """
+    return f"monitor-chat-{monitored_chat_id}"
+
+def _keys(monitored_chat_id: int) -> List[str]:
+    lease_key = f"{KEY_PREFIX}{monitored_chat_id}"
+    return [lease_key, f"{lease_key}:waiters"]
+
+def _queued_lease_ms() -> int:
+    return int(settings.COALESCE_QUEUED_LEASE_SEC * 1000)
+
+def claim_chat_run(monitored_chat_id: int, request_id: Optional[str]) -> bool:
+    """
+    Reserve a new run for a chat, or attach the request to the run already in flight.
+
+    Args:
+        monitored_chat_id: MonitoredChat DB id.
+        request_id: Request to attach if a run is in flight (None for scheduled runs).
+
+    Returns:
+        True if the caller must enqueue the run (and release_chat_run() if that fails),
+        False if the request was attached to the in-flight run.
+    """
+    if not settings.COALESCE_ENABLED:
+        return True
+    redis = get_redis_sync()
+    script = redis.register_script(_CLAIM_LUA)
+    owned = bool(script(keys=_keys(monitored_chat_id), args=[request_id or SCHEDULED_TOKEN, _queued_lease_ms()]))
+    if not owned:
+        logger.info(f"Chat run already in flight for monitored_chat_id={monitored_chat_id}; attached request_id={request_id}")
+    return owned
+
+def claim_chat_runs(monitored_chat_ids: List[int]) -> List[int]:
+    """
+    Reserve scheduled runs for many chats in one pipeline, skipping chats in flight.
+
+    Returns:
+        The ids whose runs the caller must enqueue.
+    """
+    if not settings.COALESCE_ENABLED or not monitored_chat_ids:
+        return list(monitored_chat_ids)
+    pipe = get_redis_sync().pipeline(transaction=False)
+    for mc_id in monitored_chat_ids:
+        pipe.set(_keys(mc_id)[0], SCHEDULED_TOKEN, nx=True, px=_queued_lease_ms())
+    claimed = [mc_id for mc_id, ok in zip(monitored_chat_ids, pipe.execute()) if ok]
+    if len(claimed) < len(monitored_chat_ids):
+        logger.info(f"Skipped {len(monitored_chat_ids) - len(claimed)} scheduled run(s) already in flight")
+    return claimed
+
+def release_chat_run(monitored_chat_id: int) -> None:
+    """
+    Drop a chat's run reservation (when enqueueing the claimed run failed).
+    """
+    if settings.COALESCE_ENABLED:
+        get_redis_sync().delete(_keys(monitored_chat_id)[0])
+
+class ChatRunLease:
+    """
+    The worker side of a chat's in-flight lease for one job.
+    """
+
+    def __init__(self, monitored_chat_id: int, request_id: Optional[str]) -> None:
+        self.monitored_chat_id = monitored_chat_id
+        self.token = request_id or SCHEDULED_TOKEN
+        self.keys = _keys(monitored_chat_id)
+        self.lease_ms = int(settings.COALESCE_LEASE_SEC * 1000)
+        self.finished = False
+
+    async def start(self) -> bool:
+        """
+        Take over the lease when the job starts.
+
+        Returns:
+            True if this job should run; False if another run for the chat is in flight
+            (the request is then attached to it). Runs if Redis is unavailable.
+        """
+        if not settings.COALESCE_ENABLED:
+            self.finished = True
+            return True
+        try:
+            redis = get_redis_async()
+            script = redis.register_script(_START_LUA)
+            if await script(keys=self.keys, args=[self.token, self.lease_ms]):
+                return True
+        except Exception as e:
+            logger.warning(f"Chat run lease unavailable, running uncoalesced: {e}")
+            self.finished = True
+            return True
+        self.finished = True
+        logger.info(f"Run for monitored_chat_id={self.monitored_chat_id} already in flight; attached {self.token}")
+        return False
+
+    async def _renew(self) -> None:
+        interval = max(self.lease_ms / 3000, 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                redis = get_redis_async()
+                script = redis.register_script(_RENEW_LUA)
+                if not await script(keys=self.keys, args=[self.token, self.lease_ms]):
+                    logger.warning(f"Chat run lease lost for monitored_chat_id={self.monitored_chat_id}")
+                    return
+            except Exception as e:
+                logger.warning(f"Chat run lease renewal failed: {e}")
+
+    @asynccontextmanager
+    async def held(self) -> AsyncIterator[None]:
+        """
+        Keep renewing the lease while the block runs.
+        """
+        renewer = asyncio.create_task(self._renew())
+        try:
+            yield
+        finally:
+            renewer.cancel()
+
+    async def finish(self) -> List[str]:
+        """
+        Release the lease (once) and return the request_ids attached to this run.
+        """
+        if self.finished:
+            return []
+        self.finished = True
+        try:
+            redis = get_redis_async()
+            script = redis.register_script(_FINISH_LUA)
+            waiters: List[Any] = await script(keys=self.keys, args=[self.token])
+        except Exception as e:
+            logger.warning(f"Failed to release chat run lease, it will expire: {e}")
+            return []
+        return [w.decode() if isinstance(w, bytes) else w for w in waiters]
+
+# --- Pytest skeleton ---
+
+"""
+import pytest
+from app.worker import coalescing
+
+def test_chat_job_id_is_deterministic():
+    assert coalescing.chat_job_id(7) == coalescing.chat_job_id(7) == "monitor-chat-7"
+
+@pytest.mark.asyncio
+async def test_second_request_attaches_and_gets_released(redis_server):
+    # Needs a Redis server: the first claim owns the run, the second attaches,
+    # and the owner's finish() returns the attached request id.
+    assert coalescing.claim_chat_run(1, "a") is True
+    assert coalescing.claim_chat_run(1, "b") is False
+    lease = coalescing.ChatRunLease(1, "a")
+    assert await lease.start() is True
+    assert await lease.finish() == ["b"]
+"""
@@ -0,0 +1,142 @@
+# Near-duplicate suppression for cleaned history
+
+"""
+Collapse near-duplicate history lines before summarization.
+
+Each line (without its `[YYYY-MM-DD HH:MM]` prefix) gets a 64-bit SimHash over its
+words. Lines whose fingerprints differ in at most `max_distance` bits are treated as
+copies: the first occurrence is kept with a ` (xN)` repeat count and the rest are
+dropped. Candidates are found with LSH banding (four 16-bit bands), which
+finds every pair within 3 bits (pigeonhole) without comparing every pair of lines;
+beyond that a match would depend on which bits differ, so larger distances are
+capped at MAX_DISTANCE.
+"""
+
+import hashlib
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger("telegram_insight_agent.dedup")
+
+FINGERPRINT_BITS = 64
+_BANDS = 4
+_BAND_BITS = FINGERPRINT_BITS // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+# Largest distance banding is guaranteed to find: differing bits must leave one band intact
+MAX_DISTANCE = _BANDS - 1
+# Bucket entries compared per band; bounds the cost of crowded buckets
+_MAX_BUCKET_SCAN = 64
+_LINE_PREFIX_RE = re.compile(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}\] ")
+_TOKEN_RE = re.compile(r"\w+")
+
+# Features per fingerprint; per-bit counters are one byte wide
+_MAX_FEATURES = 255
+_BIT_TO_BYTE = bytes.maketrans(b"01", b"\x00\x01")
+
+@lru_cache(maxsize=1 << 16)
+def _spread_feature_hash(feature: str) -> int:
+    """
+    Hash a feature to 64 bits and spread bit i into byte i of a 512-bit integer.
+
+    Summing spread hashes then counts, for every bit position at once, how many
+    features have that bit set. blake2b rather than hash(): fingerprints must not
+    change between processes.
+    """
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    bits = format(int.from_bytes(digest, "big"), "064b").encode("ascii")
+    return int.from_bytes(bits.translate(_BIT_TO_BYTE), "big")
+
+@lru_cache(maxsize=_MAX_FEATURES + 1)
+def _majority_table(feature_count: int) -> bytes:
+    # Maps a per-bit counter to b"1" if most features set that bit, else b"0"
+    return bytes(0x31 if 2 * count > feature_count else 0x30 for count in range(256))
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of a text over its lowercased words (the first 255).
+
+    Texts without any word characters (emoji, punctuation) hash as a single feature,
+    so they only match exact copies.
+    """
+    features = _TOKEN_RE.findall(text.lower())[:_MAX_FEATURES] or [text]
+    counters = sum(map(_spread_feature_hash, features)).to_bytes(FINGERPRINT_BITS, "big")
+    return int(counters.translate(_majority_table(len(features))), 2)
+
+def dedup_lines(lines: List[str], max_distance: int) -> Tuple[List[str], Dict[str, float]]:
+    """
+    Collapse near-duplicate lines, keeping the first occurrence with a repeat count.
+
+    Args:
+        lines: Cleaned history lines, in order.
+        max_distance: Maximum Hamming distance (bits out of 64) for two lines to count
+            as duplicates; 0 collapses only lines with identical fingerprints. Values
+            above MAX_DISTANCE are capped to it.
+
+    Returns:
+        (deduplicated lines in original order, stats with input/output lines and chars
+        and the percentage reduction in characters).
+    """
+    if max_distance > MAX_DISTANCE:
+        logger.warning(f"Dedup distance {max_distance} exceeds what banding can find; using {MAX_DISTANCE}")
+        max_distance = MAX_DISTANCE
+    buckets: List[Dict[int, List[int]]] = [{} for _ in range(_BANDS)]
+    kept: List[List] = []  # [line, fingerprint, repeat count]
+    for line in lines:
+        fingerprint = simhash(_LINE_PREFIX_RE.sub("", line, count=1))
+        keys = [(fingerprint >> (band * _BAND_BITS)) & _BAND_MASK for band in range(_BANDS)]
+        match = None
+        for band, key in enumerate(keys):
+            for idx in reversed(buckets[band].get(key, ())[-_MAX_BUCKET_SCAN:]):
+                if (kept[idx][1] ^ fingerprint).bit_count() <= max_distance:
+                    match = idx
+                    break
+            if match is not None:
+                break
+        if match is not None:
+            kept[match][2] += 1
+            continue
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(len(kept))
+        kept.append([line, fingerprint, 1])
+
+    output = [f"{line} (x{count})" if count > 1 else line for line, _, count in kept]
+    input_chars = sum(len(line) for line in lines) + max(len(lines) - 1, 0)
+    output_chars = sum(len(line) for line in output) + max(len(output) - 1, 0)
+    stats = {
+        "input_lines": len(lines),
+        "output_lines": len(output),
+        "collapsed_lines": len(lines) - len(output),
+        "input_chars": input_chars,
+        "output_chars": output_chars,
+        "reduction_pct": round(100.0 * (input_chars - output_chars) / input_chars, 1) if input_chars else 0.0,
+    }
+    logger.info(
+        f"Dedup (max_distance={max_distance}): {stats['input_lines']} -> {stats['output_lines']} lines, "
+        f"{input_chars} -> {output_chars} chars ({stats['reduction_pct']}% smaller)"
+    )
+    return output, stats
+
+# --- Pytest skeleton ---
+
+"""
+from app.worker.dedup import dedup_lines, simhash
+
+def test_simhash_is_stable_and_close_for_near_copies():
+    a = simhash("Big sale today only, join our channel for free crypto signals now")
+    b = simhash("Big sale today only!! join our channel for free crypto signals now")
+    assert a == simhash("Big sale today only, join our channel for free crypto signals now")
+    assert (a ^ b).bit_count() <= 3
+
+def test_dedup_collapses_with_count_and_keeps_order():
+    lines = ["[2024-01-01 10:00] buy now cheap tokens here", "[2024-01-01 10:01] hello all",
+             "[2024-01-01 10:02] buy now cheap tokens here"]
+    out, stats = dedup_lines(lines, max_distance=3)
+    assert out == ["[2024-01-01 10:00] buy now cheap tokens here (x2)", "[2024-01-01 10:01] hello all"]
+    assert stats["collapsed_lines"] == 1 and stats["reduction_pct"] > 0
+
+def test_dedup_keeps_distinct_lines():
+    lines = ["the deploy is scheduled for friday", "lunch at the usual place?"]
+    assert dedup_lines(lines, max_distance=3)[0] == lines
+"""
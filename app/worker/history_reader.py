@@ -0,0 +1,147 @@
+# Incremental reader for tdl history exports
+
+"""
+Streaming reader for tdl `chat export` JSON files.
+
+tdl writes exports as one `{"id": ..., "messages": [...]}` document. Loading it with
+`json.load` materializes every message at once; this reader yields one message dict
+at a time so memory stays flat regardless of export size.
+"""
+
+import json
+import logging
+from typing import Any, Dict, Iterator, TextIO
+
+logger = logging.getLogger("telegram_insight_agent.history_reader")
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\n\r"
+
+class _JsonStreamBuffer:
+    """
+    Sliding text buffer over a file that decodes one JSON value at a time.
+    """
+
+    def __init__(self, fp: TextIO, chunk_size: int) -> None:
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        # Drop the consumed prefix so the buffer never grows past a chunk or two
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self._fp.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        """
+        Skip whitespace and return the next character without consuming it ('' at EOF).
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed tdl export: expected {char!r}, found {found!r}")
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """
+        Decode the next JSON value, reading more input until it is complete.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A scalar ending exactly at the buffer edge may be truncated (e.g. a number)
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_tdl_messages(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Yield message dicts from a tdl history export one at a time.
+
+    Args:
+        path: Path to the tdl export JSON file.
+        chunk_size: Number of characters read from disk per refill.
+
+    Yields:
+        Message dicts in file order.
+
+    Raises:
+        ValueError or json.JSONDecodeError if the file is not a tdl export.
+    """
+    logger.debug(f"Streaming tdl export: {path}")
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JsonStreamBuffer(f, chunk_size)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            key = stream.decode()
+            stream.expect(":")
+            if key == "messages":
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.pos += 1
+                else:
+                    while True:
+                        msg = stream.decode()
+                        if isinstance(msg, dict):
+                            count += 1
+                            yield msg
+                        sep = stream.peek()
+                        stream.pos += 1
+                        if sep == "]":
+                            break
+                        if sep != ",":
+                            raise ValueError(f"Malformed tdl export: unexpected {sep!r} in messages array")
+            else:
+                stream.decode()
+            sep = stream.peek()
+            stream.pos += 1
+            if sep == "}":
+                break
+            if sep != ",":
+                raise ValueError(f"Malformed tdl export: unexpected {sep!r} after key {key!r}")
+    logger.debug(f"Streamed {count} messages from {path}")
+
+# --- Pytest skeleton ---
+
+"""
+import json
+from app.worker.history_reader import iter_tdl_messages
+
+def test_iter_tdl_messages_matches_json_load(tmp_path):
+    path = tmp_path / "history.json"
+    data = {"id": 1, "messages": [{"id": i, "type": "message", "text": f"msg {i}"} for i in range(1000)]}
+    path.write_text(json.dumps(data))
+    assert list(iter_tdl_messages(str(path), chunk_size=7)) == data["messages"]
+
+def test_iter_tdl_messages_empty(tmp_path):
+    path = tmp_path / "history.json"
+    path.write_text('{"id":1,"messages":[]}')
+    assert list(iter_tdl_messages(str(path))) == []
+"""
@@ -0,0 +1,197 @@
+# Multi-process RQ worker launcher
+
+"""
+Start and supervise several RQ workers from one preloaded parent process.
+
+The parent imports the task module (and with it SQLAlchemy, httpx, config) once, then
+forks one child per worker, so children start warm instead of importing everything
+again. The parent opens no connections or event loop before forking; each child
+builds its own in WorkerRuntime. Children that exit unexpectedly are restarted, with
+a growing delay if they keep crashing on startup. SIGTERM/SIGINT to the parent sends
+each child one SIGTERM (RQ's warm shutdown: finish the current job, then exit).
+
+Execution modes per worker:
+    inline: SimpleWorker runs jobs in the worker process on its warm async runtime.
+    fork: rq.Worker forks a work horse per job (isolation at the cost of re-warming).
+    async: AsyncJobConsumer runs up to ASYNC_CONSUMER_CONCURRENCY jobs at once on the
+        warm runtime (best for the I/O-bound pipeline).
+"""
+
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Optional
+
+from rq import SimpleWorker, Worker
+
+from app.shared.redis_client import get_redis_sync
+from app.worker.lanes import worker_queue_names
+from app.worker.runtime import get_runtime
+from app.worker.async_consumer import AsyncJobConsumer
+import app.worker.tasks  # noqa: F401, preload tasks and their dependencies before forking
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.worker.launcher")
+
+EXECUTION_MODES = ("inline", "fork", "async")
+# A child that exits sooner than this after starting counts as a crash loop
+_MIN_HEALTHY_UPTIME_SEC = 30.0
+_MAX_RESTART_DELAY_SEC = 60.0
+_SUPERVISE_POLL_SEC = 0.5
+
+def work(queues: List[str], execution: str = "inline", name: Optional[str] = None) -> None:
+    """
+    Run one RQ worker (or async consumer) in this process until it is told to stop.
+
+    Args:
+        queues: Queue names, highest priority first.
+        execution: "inline" (no fork per job), "fork" or "async".
+        name: Async consumer name; must be stable across restarts (defaults to the host name).
+    """
+    if execution not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode: {execution}")
+    runtime = get_runtime()
+    try:
+        if execution == "async":
+            consumer = AsyncJobConsumer(queues, settings.ASYNC_CONSUMER_CONCURRENCY, name=name)
+            runtime.run(consumer.run())
+            return
+        if execution == "inline":
+            # Jobs run in this process (no fork per job) so they share one warm async runtime
+            runtime.start()
+        worker_class = SimpleWorker if execution == "inline" else Worker
+        worker = worker_class(queues, connection=get_redis_sync())
+        logger.info(f"RQ {worker_class.__name__} starting in pid={os.getpid()} (queues: {', '.join(queues)})")
+        worker.work()
+    finally:
+        runtime.close()
+
+class WorkerPool:
+    """
+    Fork and supervise `workers` RQ workers, the first `reserved_high` of them high-only.
+    """
+
+    def __init__(self, workers: int, reserved_high: int = 0, execution: str = "inline") -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if not 0 <= reserved_high <= workers:
+            raise ValueError("reserved_high must be between 0 and workers")
+        if execution not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {execution}")
+        self.workers = workers
+        self.reserved_high = reserved_high
+        self.execution = execution
+        self._children: Dict[int, int] = {}  # pid -> slot
+        self._started_at: Dict[int, float] = {}  # slot -> start time of its current child
+        self._restart_delay: Dict[int, float] = {}  # slot -> delay before the next restart
+        self._restart_due: Dict[int, float] = {}  # slot -> monotonic time to restart at
+        self._stopping = False
+        self.restarts = 0
+
+    def _queues_for(self, slot: int) -> List[str]:
+        return worker_queue_names(high_only=slot < self.reserved_high)
+
+    def _spawn(self, slot: int) -> None:
+        queues = self._queues_for(slot)
+        pid = os.fork()
+        if pid == 0:
+            # Child: default signal handling so RQ can install its own, and a process group
+            # of its own so Ctrl-C reaches only the parent, which forwards a single SIGTERM
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.setpgid(0, 0)
+            code = 0
+            try:
+                work(queues, self.execution, name=f"{socket.gethostname()}-{slot}")
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except BaseException as e:
+                logger.exception(f"Worker slot {slot} crashed: {e}")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self._children[pid] = slot
+        self._started_at[slot] = time.monotonic()
+        logger.info(f"Started worker slot {slot} as pid={pid} (queues: {', '.join(queues)})")
+
+    def _handle_signal(self, signum: int, frame: Optional[object]) -> None:
+        if not self._stopping:
+            logger.info(f"Received signal {signum}, stopping {len(self._children)} worker(s)")
+        self._stopping = True
+        self._restart_due.clear()
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self) -> None:
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()
+                return
+            if pid == 0:
+                return
+            slot = self._children.pop(pid, None)
+            if slot is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if self._stopping:
+                logger.info(f"Worker slot {slot} (pid={pid}) exited with {code}")
+                continue
+            uptime = time.monotonic() - self._started_at.get(slot, 0.0)
+            if uptime >= _MIN_HEALTHY_UPTIME_SEC:
+                delay = 0.0
+            else:
+                delay = min(max(self._restart_delay.get(slot, 0.0) * 2, 1.0), _MAX_RESTART_DELAY_SEC)
+            self._restart_delay[slot] = delay
+            self._restart_due[slot] = time.monotonic() + delay
+            logger.warning(f"Worker slot {slot} (pid={pid}) exited with {code} after {uptime:.0f}s; restarting in {delay:.0f}s")
+
+    def run(self) -> None:
+        """
+        Start all workers and supervise them until SIGTERM/SIGINT and all have exited.
+        """
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        logger.info(f"Starting {self.workers} worker(s) ({self.reserved_high} reserved for high priority, execution={self.execution})")
+        for slot in range(self.workers):
+            self._spawn(slot)
+        while self._children or (self._restart_due and not self._stopping):
+            self._reap()
+            now = time.monotonic()
+            for slot, due in list(self._restart_due.items()):
+                if due <= now and not self._stopping:
+                    del self._restart_due[slot]
+                    self.restarts += 1
+                    self._spawn(slot)
+            time.sleep(_SUPERVISE_POLL_SEC)
+        logger.info("All workers stopped.")
+
+# --- Pytest skeleton ---
+
+"""
+import pytest
+from app.worker.launcher import WorkerPool
+
+def test_reserved_slots_listen_to_high_only():
+    pool = WorkerPool(workers=3, reserved_high=1)
+    assert pool._queues_for(0) == [pool._queues_for(1)[0]]
+    assert len(pool._queues_for(1)) > 1
+
+def test_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        WorkerPool(workers=2, reserved_high=3)
+    with pytest.raises(ValueError):
+        WorkerPool(workers=1, execution="threads")
+
+def test_crashed_child_is_restarted(monkeypatch):
+    # Monkeypatch launcher.work to exit immediately, run the pool in a thread, and
+    # assert pool.restarts grows until SIGTERM is delivered.
+    pass
+"""
@@ -0,0 +1,142 @@
+# Content-addressed cache for LLM summaries
+
+"""
+Two-tier cache for LLM responses, keyed on a hash of (model, prompt, max_tokens, history).
+
+A size-bounded in-process LRU answers repeat requests within a worker without any I/O;
+a Redis tier with a TTL shares results across workers. A hit skips the LLM call.
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.shared.redis_client import get_redis_async
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.llm_cache")
+
+REDIS_KEY_PREFIX = "llm_cache:"
+
+class LLMResponseCache:
+    """
+    Local LRU + Redis cache for LLM responses, with hit/miss counters.
+    """
+
+    def __init__(self, max_local_entries: int, ttl_sec: int) -> None:
+        self.max_local_entries = max_local_entries
+        self.ttl_sec = ttl_sec
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.counters: Dict[str, int] = {"local_hits": 0, "redis_hits": 0, "misses": 0, "stores": 0, "redis_errors": 0}
+
+    @staticmethod
+    def make_key(model: str, prompt: str, max_tokens: int, history_text: str) -> str:
+        """
+        Hash the request inputs into a cache key.
+
+        Fields are length-prefixed so different splits of the same bytes cannot collide.
+        """
+        digest = hashlib.sha256()
+        for part in (model, prompt, str(max_tokens), history_text):
+            data = part.encode("utf-8")
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: str) -> None:
+        self._local[key] = (time.monotonic() + self.ttl_sec, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_local_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response: local LRU first, then Redis.
+
+        Returns:
+            Cached response text, or None on a miss. Redis errors count as misses.
+        """
+        value = self._get_local(key)
+        if value is not None:
+            self.counters["local_hits"] += 1
+            logger.info(f"LLM cache hit (local): {key[:12]}")
+            return value
+        redis = get_redis_async()
+        try:
+            value = await redis.get(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            self.counters["redis_errors"] += 1
+            logger.warning(f"LLM cache Redis lookup failed: {e}")
+            value = None
+        if value is not None:
+            self.counters["redis_hits"] += 1
+            self._set_local(key, value)
+            logger.info(f"LLM cache hit (redis): {key[:12]}")
+            return value
+        self.counters["misses"] += 1
+        logger.debug(f"LLM cache miss: {key[:12]}")
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        """
+        Store a response in both tiers. Redis errors are logged and ignored.
+        """
+        self._set_local(key, value)
+        self.counters["stores"] += 1
+        redis = get_redis_async()
+        try:
+            await redis.set(REDIS_KEY_PREFIX + key, value, ex=self.ttl_sec)
+        except Exception as e:
+            self.counters["redis_errors"] += 1
+            logger.warning(f"LLM cache Redis store failed: {e}")
+
+    def clear_local(self) -> None:
+        self._local.clear()
+
+_cache: Optional[LLMResponseCache] = None
+
+def get_llm_cache() -> LLMResponseCache:
+    """
+    Return the process-wide LLM response cache.
+    """
+    global _cache
+    if _cache is None:
+        _cache = LLMResponseCache(settings.LLM_CACHE_LOCAL_MAX_ENTRIES, settings.LLM_CACHE_TTL_SEC)
+    return _cache
+
+# --- Pytest skeleton ---
+
+"""
+import pytest
+from app.worker.llm_cache import LLMResponseCache
+
+def test_make_key_changes_with_inputs():
+    k1 = LLMResponseCache.make_key("m", "p", 10, "h")
+    assert k1 == LLMResponseCache.make_key("m", "p", 10, "h")
+    assert k1 != LLMResponseCache.make_key("m", "p", 11, "h")
+    assert LLMResponseCache.make_key("m", "ab", 10, "c") != LLMResponseCache.make_key("m", "a", 10, "bc")
+
+def test_local_lru_evicts_oldest():
+    cache = LLMResponseCache(max_local_entries=2, ttl_sec=60)
+    for k in ("a", "b", "c"):
+        cache._set_local(k, k)
+    assert cache._get_local("a") is None and cache._get_local("c") == "c"
+
+@pytest.mark.asyncio
+async def test_get_falls_back_to_redis(monkeypatch):
+    # monkeypatch get_redis_async to return a fake with async get/set
+    pass
+"""
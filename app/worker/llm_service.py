@@ -1,23 +1,103 @@
 # LLM API interaction
 
+import asyncio
 import httpx
 import logging
-from typing import Optional
+import os
+from typing import Any, Callable, Dict, List, Optional
 from config import settings
+from app.worker.token_budget import allocate_budget, count_tokens, input_budget
+from app.worker.llm_cache import get_llm_cache
 
 logger = logging.getLogger("telegram_insight_agent.llm_service")
 
-async def get_llm_summary(history_text: str, prompt: str, max_tokens: int = 2048) -> str:
+_client: Optional[httpx.AsyncClient] = None
+_client_pid: Optional[int] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _build_llm_client() -> httpx.AsyncClient:
     """
-    Call LLM API (OpenAI-compatible) and return summary.
+    Build a pooled keep-alive client from the LLM_HTTP_* settings.
+    """
+    limits = httpx.Limits(
+        max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY_SEC,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.LLM_CONNECT_TIMEOUT_SEC,
+        read=settings.LLM_READ_TIMEOUT_SEC,
+        write=settings.LLM_WRITE_TIMEOUT_SEC,
+        pool=settings.LLM_POOL_TIMEOUT_SEC,
+    )
+    http2 = settings.LLM_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("LLM_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1")
+        http2 = False
+    logger.info(
+        f"Creating shared LLM HTTP client: max_connections={limits.max_connections}, "
+        f"keepalive={limits.max_keepalive_connections}, http2={http2}"
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
 
-    Args:
-        history_text: The cleaned chat history to summarize.
-        prompt: The LLM prompt.
-        max_tokens: Max tokens for LLM output.
+def get_llm_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide HTTP client for LLM calls, creating it on first use.
 
-    Returns:
-        LLM summary as string.
+    The client's pooled connections belong to one process and one event loop; a new
+    client is built after a fork or when called from a different loop.
+    """
+    global _client, _client_pid, _client_loop
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    stale = _client is not None and (_client_pid != os.getpid() or (loop is not None and _client_loop is not loop))
+    if stale:
+        # The old client's sockets belong to another process/loop; drop it without closing
+        logger.info("Discarding LLM HTTP client bound to another process or event loop")
+        _client = None
+    if _client is None or _client.is_closed:
+        _client = _build_llm_client()
+        _client_pid = os.getpid()
+        _client_loop = loop
+    return _client
+
+async def close_llm_client() -> None:
+    """
+    Close the shared LLM HTTP client, if one was created by this process.
+    """
+    global _client, _client_pid, _client_loop
+    if _client is not None and not _client.is_closed and _client_pid == os.getpid():
+        await _client.aclose()
+        logger.info("Closed shared LLM HTTP client")
+    _client = None
+    _client_pid = None
+    _client_loop = None
+
+MAP_PROMPT = (
+    "You are reading one part of a longer chat log. Extract the key topics, decisions, "
+    "questions and notable messages from this part as concise bullet points. Your notes "
+    "will be merged with notes from the other parts into a final summary."
+)
+
+async def _chat_completion(
+    system_prompt: str,
+    user_content: str,
+    max_tokens: int,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Send one chat completion request and return the message content.
+
+    If stats is given, the API's reported token usage is accumulated into it.
 
     Raises:
         Exception for HTTP or JSON parsing errors.
@@ -25,13 +105,11 @@ async def get_llm_summary(history_text: str, prompt: str, max_tokens: int = 2048
     url = getattr(settings, "LLM_ENDPOINT_URL", None) or "https://api.openai.com/v1/chat/completions"
     api_key = settings.LLM_API_KEY
     model = getattr(settings, "LLM_MODEL_NAME", "gpt-3.5-turbo")
-    max_chars = 8000
-    truncated_history = history_text[-max_chars:] if len(history_text) > max_chars else history_text
     payload = {
         "model": model,
         "messages": [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": truncated_history}
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
         ],
         "max_tokens": max_tokens,
         "temperature": 0.3
@@ -40,16 +118,22 @@ async def get_llm_summary(history_text: str, prompt: str, max_tokens: int = 2048
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
-    logger.info(f"Requesting LLM summary with model={model}, tokens={max_tokens}")
+    logger.info(f"Requesting LLM completion with model={model}, tokens={max_tokens}, input_chars={len(user_content)}")
     try:
-        async with httpx.AsyncClient(timeout=60) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            logger.debug(f"LLM API response code: {response.status_code}")
-            response.raise_for_status()
-            data = response.json()
-            logger.debug(f"LLM API response body: {data}")
-            # OpenAI format: choices[0].message.content
-            return data["choices"][0]["message"]["content"]
+        client = get_llm_client()
+        response = await client.post(url, json=payload, headers=headers)
+        logger.debug(f"LLM API response code: {response.status_code}")
+        response.raise_for_status()
+        data = response.json()
+        logger.debug(f"LLM API response body: {data}")
+        if stats is not None:
+            usage = data.get("usage") or {}
+            stats["llm_calls"] = stats.get("llm_calls", 0) + 1
+            for key in ("prompt_tokens", "completion_tokens"):
+                if isinstance(usage.get(key), int):
+                    stats[key] = stats.get(key, 0) + usage[key]
+        # OpenAI format: choices[0].message.content
+        return data["choices"][0]["message"]["content"]
     except httpx.HTTPStatusError as e:
         logger.error(f"LLM API HTTP error: {e.response.status_code} - {e.response.text}")
         raise
@@ -57,6 +141,171 @@ async def get_llm_summary(history_text: str, prompt: str, max_tokens: int = 2048
         logger.exception(f"LLM API call failed: {e}")
         raise
 
+def split_history_chunks(history_text: str, max_units: int, measure: Callable[[str], int] = len) -> List[str]:
+    """
+    Split cleaned history into chunks of at most max_units, breaking on message (line) boundaries.
+
+    A single message larger than max_units is split on its own.
+
+    Args:
+        history_text: Newline-separated cleaned messages.
+        max_units: Maximum chunk size, in the units returned by measure.
+        measure: Size function for a piece of text (characters by default, or a token counter).
+
+    Returns:
+        List of chunks, in original order.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_size = 0
+    for line in history_text.split("\n"):
+        size = measure(line) + 1
+        if size > max_units:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_size = [], 0
+            # Cut an oversized message proportionally; measure is not assumed to be linear
+            step = max(1, len(line) * max_units // size)
+            chunks.extend(line[i:i + step] for i in range(0, len(line), step))
+            continue
+        if current and current_size + size > max_units:
+            chunks.append("\n".join(current))
+            current, current_size = [], 0
+        current.append(line)
+        current_size += size
+    if current and any(current):
+        chunks.append("\n".join(current))
+    return chunks
+
+async def _map_chunks(chunks: List[str], map_prompt: str, concurrency: int, stats: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Summarize chunks concurrently (at most `concurrency` requests in flight), preserving order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _map_one(index: int, chunk: str) -> str:
+        async with semaphore:
+            logger.debug(f"Map step: chunk {index + 1}/{len(chunks)} ({len(chunk)} chars)")
+            return await _chat_completion(map_prompt, chunk, settings.LLM_MAP_MAX_TOKENS, stats)
+
+    return list(await asyncio.gather(*(_map_one(i, c) for i, c in enumerate(chunks))))
+
+async def map_reduce_summary(
+    history_text: str,
+    prompt: str,
+    max_tokens: int = 2048,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Summarize a history larger than one request: summarize chunks concurrently, then
+    reduce the partial summaries with the chat's prompt.
+
+    Chunks are sized to the map request's token budget. Partial summaries that still
+    exceed the reduce budget are reduced again in further rounds, up to
+    LLM_MAP_MAX_ROUNDS; if they still do not fit after that (or a round stops
+    shrinking them), they are sampled down to the reduce budget.
+
+    Args:
+        history_text: The cleaned chat history to summarize.
+        prompt: The chat's LLM prompt, applied in the reduce pass.
+        max_tokens: Max tokens for the final summary.
+        stats: Optional dict that receives token usage.
+
+    Returns:
+        Final summary as string.
+    """
+    map_prompt = f"{MAP_PROMPT}\n\nThe final summary must follow these instructions, so keep what they need:\n{prompt}"
+    map_budget = input_budget(map_prompt, settings.LLM_MAP_MAX_TOKENS)
+    reduce_budget = input_budget(prompt, max_tokens)
+    chunks = split_history_chunks(history_text, map_budget, count_tokens)
+    round_no = 1
+    previous_tokens = float("inf")
+    while True:
+        logger.info(f"Map-reduce round {round_no}: {len(chunks)} chunks, concurrency={settings.LLM_MAP_CONCURRENCY}")
+        partials = await _map_chunks(chunks, map_prompt, settings.LLM_MAP_CONCURRENCY, stats)
+        if stats is not None:
+            stats["map_chunks"] = stats.get("map_chunks", 0) + len(chunks)
+        combined = "\n\n".join(f"Part {i + 1}/{len(partials)}:\n{p}" for i, p in enumerate(partials))
+        combined_tokens = count_tokens(combined)
+        fits = combined_tokens <= reduce_budget
+        if not fits and len(partials) > 1 and round_no < settings.LLM_MAP_MAX_ROUNDS and combined_tokens < previous_tokens:
+            chunks = split_history_chunks(combined, map_budget, count_tokens)
+            previous_tokens = combined_tokens
+            round_no += 1
+            continue
+        if not fits:
+            logger.warning(
+                f"Partial summaries still {combined_tokens} tokens after {round_no} round(s) "
+                f"(reduce budget {reduce_budget}); sampling them to fit"
+            )
+            combined, combined_tokens = allocate_budget(combined, reduce_budget)
+            if stats is not None:
+                stats["map_reduce_truncated"] = True
+        if stats is not None:
+            stats["map_reduce_rounds"] = round_no
+        return await _chat_completion(prompt, combined, max_tokens, stats)
+
+async def get_llm_summary(
+    history_text: str,
+    prompt: str,
+    max_tokens: int = 2048,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Call LLM API (OpenAI-compatible) and return summary.
+
+    Responses are cached on (model, prompt, max_tokens, history) when LLM_CACHE_ENABLED
+    is set, so an unchanged history is answered without calling the API.
+
+    The input budget is the model's context (LLM_CONTEXT_TOKENS) minus the prompt and
+    max_tokens. Histories within budget go out in one request. Larger ones use
+    map-reduce when LLM_MAP_REDUCE_ENABLED is set, otherwise they are sampled evenly
+    across days to fit.
+
+    Args:
+        history_text: The cleaned chat history to summarize.
+        prompt: The LLM prompt.
+        max_tokens: Max tokens for LLM output.
+        stats: Optional dict that receives budgeting details and token usage.
+
+    Returns:
+        LLM summary as string.
+
+    Raises:
+        Exception for HTTP or JSON parsing errors.
+    """
+    if stats is None:
+        stats = {}
+    if not settings.LLM_CACHE_ENABLED:
+        return await _summarize(history_text, prompt, max_tokens, stats)
+    cache = get_llm_cache()
+    key = cache.make_key(settings.LLM_MODEL_NAME, prompt, max_tokens, history_text)
+    cached = await cache.get(key)
+    if cached is not None:
+        stats["cache"] = "hit"
+        return cached
+    stats["cache"] = "miss"
+    summary = await _summarize(history_text, prompt, max_tokens, stats)
+    await cache.set(key, summary)
+    return summary
+
+async def _summarize(history_text: str, prompt: str, max_tokens: int, stats: Dict[str, Any]) -> str:
+    """
+    Pick single-request, map-reduce or budgeted summarization for a history.
+    """
+    budget = input_budget(prompt, max_tokens)
+    history_tokens = count_tokens(history_text)
+    stats.update({"input_budget_tokens": budget, "history_tokens": history_tokens})
+    if history_tokens <= budget:
+        stats.update({"mode": "single", "input_tokens": history_tokens})
+        return await _chat_completion(prompt, history_text, max_tokens, stats)
+    if settings.LLM_MAP_REDUCE_ENABLED:
+        stats.update({"mode": "map_reduce", "input_tokens": history_tokens})
+        return await map_reduce_summary(history_text, prompt, max_tokens, stats)
+    selected, used = allocate_budget(history_text, budget)
+    stats.update({"mode": "budgeted", "input_tokens": used})
+    return await _chat_completion(prompt, selected, max_tokens, stats)
+
 # --- Test skeleton for get_llm_summary ---
 
 """
@@ -73,6 +322,17 @@ async def test_llm_http_error(monkeypatch):
     # Simulate httpx.HTTPStatusError
     pass
 
+@pytest.mark.asyncio
+async def test_llm_client_is_shared():
+    from app.worker.llm_service import get_llm_client, close_llm_client
+    assert get_llm_client() is get_llm_client()
+    await close_llm_client()
+
+def test_split_history_chunks_respects_lines():
+    from app.worker.llm_service import split_history_chunks
+    chunks = split_history_chunks("aaa\nbbb\nccc", 8)
+    assert chunks == ["aaa\nbbb", "ccc"]
+
 @pytest.mark.asyncio
 async def test_llm_json_error(monkeypatch):
     # Simulate invalid JSON in response
@@ -0,0 +1,135 @@
+# Long-lived async runtime for RQ worker processes
+
+"""
+Per-process async runtime for worker jobs.
+
+RQ job functions are synchronous, so each job used to spin up a fresh event loop. The
+async DB pool, HTTP client and Redis connections are bound to the loop that created
+them, which made them unusable (or silently broken) across jobs. WorkerRuntime keeps
+one event loop per process, warms those resources once, and runs job coroutines on it.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Optional
+
+from app.shared.database import engine, test_db_connection
+from app.shared.error_handling import setup_asyncio_exception_logging
+from app.shared.redis_client import get_redis_async, close_redis_pools
+from app.worker.llm_service import get_llm_client, close_llm_client
+from app.worker.clean_pool import shutdown_clean_pool
+
+logger = logging.getLogger("telegram_insight_agent.worker.runtime")
+
+class WorkerRuntime:
+    """
+    One event loop per worker process, with warm DB, HTTP and Redis resources.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self.redis: Any = None
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """
+        Create the loop and warm shared resources for this process (idempotent).
+
+        Returns:
+            The runtime's event loop.
+        """
+        pid = os.getpid()
+        if self._loop is not None and self._pid == pid and not self._loop.is_closed():
+            return self._loop
+        if self._pid is not None and self._pid != pid:
+            self._after_fork()
+        logger.info(f"Starting worker runtime in pid={pid}")
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        setup_asyncio_exception_logging(self._loop)
+        self._pid = pid
+        self._loop.run_until_complete(self._warm_up())
+        return self._loop
+
+    def run(self, coro: Awaitable[Any]) -> Any:
+        """
+        Run a job coroutine to completion on the runtime's loop.
+
+        Args:
+            coro: Coroutine to run.
+
+        Returns:
+            The coroutine's result.
+        """
+        loop = self.start()
+        return loop.run_until_complete(coro)
+
+    def close(self) -> None:
+        """
+        Release warm resources and close the loop. Only acts in the owning process.
+        """
+        if self._loop is None or self._loop.is_closed() or self._pid != os.getpid():
+            return
+        logger.info("Shutting down worker runtime.")
+        try:
+            self._loop.run_until_complete(self._shutdown())
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    def _after_fork(self) -> None:
+        # A forked child inherits the parent's loop and pooled sockets; using them from
+        # two processes corrupts both, so drop the references without closing anything.
+        logger.info("Worker runtime detected fork, discarding inherited loop and pools.")
+        engine.sync_engine.dispose(close=False)
+        self._loop = None
+        self.redis = None
+
+    async def _warm_up(self) -> None:
+        try:
+            await test_db_connection()
+        except Exception as e:
+            logger.warning(f"DB warm-up failed, pool will connect lazily: {e}")
+        get_llm_client()
+        try:
+            self.redis = get_redis_async()
+            await self.redis.ping()
+        except Exception as e:
+            logger.warning(f"Redis warm-up failed, will connect lazily: {e}")
+        logger.info("Worker runtime warm-up complete.")
+
+    async def _shutdown(self) -> None:
+        await close_llm_client()
+        try:
+            await close_redis_pools()
+        except Exception as e:
+            logger.warning(f"Error closing Redis pools: {e}")
+        self.redis = None
+        await engine.dispose()
+        shutdown_clean_pool()
+
+_runtime = WorkerRuntime()
+
+def get_runtime() -> WorkerRuntime:
+    """
+    Return the process-wide worker runtime.
+    """
+    return _runtime
+
+# --- Pytest skeleton ---
+
+"""
+from app.worker.runtime import WorkerRuntime
+
+def test_runtime_reuses_loop(monkeypatch):
+    rt = WorkerRuntime()
+    async def noop(): pass
+    monkeypatch.setattr(rt, "_warm_up", noop)
+    monkeypatch.setattr(rt, "_shutdown", noop)
+    async def current_loop():
+        import asyncio
+        return asyncio.get_running_loop()
+    assert rt.run(current_loop()) is rt.run(current_loop())
+    rt.close()
+"""
@@ -0,0 +1,284 @@
+# Append-only per-chat store of cleaned history
+
+"""
+Per-chat segment store for cleaned history lines.
+
+Cleaned messages are kept as JSON lines (`{"id", "date", "text"}`) in append-only
+segment files under `<TDL_OUTPUT_DIR_BASE>/monitored_chat_<id>/segments/`. A small
+`index.json` records each segment's message-id and date range, line count and
+committed size, and is replaced atomically, so a run only cleans and appends its new
+messages and the LLM input is built by reading just the segments that overlap the
+requested window.
+
+An append that fails is rolled back by truncating the segment to its committed size;
+bytes past the indexed size are never read.
+"""
+
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("telegram_insight_agent.segment_store")
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+
+class SegmentStore:
+    """
+    Append-only cleaned-history segments for one chat, with an id/date range index.
+    """
+
+    def __init__(self, root_dir: str, max_segment_lines: int) -> None:
+        self.root_dir = root_dir
+        self.max_segment_lines = max_segment_lines
+        self.index_path = os.path.join(root_dir, INDEX_FILE)
+        self.segments: List[Dict[str, Any]] = self._load_index()
+
+    def _load_index(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable segment index {self.index_path}, starting empty: {e}")
+            return []
+        if index.get("version") != INDEX_VERSION:
+            logger.warning(f"Unknown segment index version in {self.index_path}, starting empty")
+            return []
+        return index.get("segments", [])
+
+    def _write_index(self) -> None:
+        os.makedirs(self.root_dir, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "segments": self.segments}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def last_id(self) -> Optional[int]:
+        """
+        Highest message id stored, or None if the store is empty.
+        """
+        ids = [seg["last_id"] for seg in self.segments if seg.get("last_id") is not None]
+        return max(ids) if ids else None
+
+    @property
+    def line_count(self) -> int:
+        return sum(seg["lines"] for seg in self.segments)
+
+    def reset(self) -> None:
+        """
+        Drop all segments (used before storing a full export).
+        """
+        if os.path.isdir(self.root_dir):
+            shutil.rmtree(self.root_dir)
+        self.segments = []
+        logger.info(f"Reset segment store {self.root_dir}")
+
+    @contextmanager
+    def appender(self) -> Iterator["SegmentAppender"]:
+        """
+        Open an append session. The index is only updated if the block succeeds.
+        """
+        os.makedirs(self.root_dir, exist_ok=True)
+        appender = SegmentAppender(self)
+        try:
+            yield appender
+        except BaseException:
+            appender.rollback()
+            raise
+        appender.commit()
+
+    def read_window(self, min_id: Optional[int] = None, since_ts: Optional[int] = None) -> List[Tuple[int, int, str]]:
+        """
+        Read stored lines with id >= min_id and date >= since_ts, in message-id order.
+
+        Only segments whose indexed range overlaps the window are opened.
+
+        Args:
+            min_id: Lowest message id to include (None for no bound).
+            since_ts: Earliest unix timestamp to include (None for no bound).
+
+        Returns:
+            List of (message id, unix date, formatted line).
+        """
+        records = []
+        opened = 0
+        for seg in self.segments:
+            if min_id is not None and seg.get("last_id") is not None and seg["last_id"] < min_id:
+                continue
+            if since_ts is not None and seg.get("last_date") is not None and seg["last_date"] < since_ts:
+                continue
+            opened += 1
+            path = os.path.join(self.root_dir, seg["file"])
+            with open(path, "rb") as f:
+                data = f.read(seg["bytes"]).decode("utf-8")
+            # split("\n"), not splitlines(): JSON leaves U+2028 and friends unescaped
+            for raw in data.split("\n"):
+                if not raw:
+                    continue
+                record = json.loads(raw)
+                msg_id, date = record.get("id"), record.get("date")
+                if min_id is not None and (msg_id is None or msg_id < min_id):
+                    continue
+                if since_ts is not None and (date is None or date < since_ts):
+                    continue
+                records.append((msg_id or 0, date or 0, record["text"]))
+        records.sort(key=lambda r: r[0])
+        logger.info(f"Read {len(records)} lines from {opened}/{len(self.segments)} segment(s) in {self.root_dir}")
+        return records
+
+class SegmentAppender:
+    """
+    Writes cleaned-history batches into the store's segments for one append session.
+    """
+
+    def __init__(self, store: SegmentStore) -> None:
+        self.store = store
+        self.lines_written = 0
+        self._file: Optional[Any] = None
+        self._entry: Optional[Dict[str, Any]] = None
+        self._new_entries: List[Dict[str, Any]] = []
+        # Updated entry and committed size of the reopened tail segment, if any
+        self._tail_entry: Optional[Dict[str, Any]] = None
+        self._tail_committed_bytes = 0
+
+    def _open_segment(self) -> None:
+        segments = self.store.segments
+        tail = segments[-1] if segments else None
+        first_open = self._tail_entry is None and not self._new_entries
+        # Only keep filling the last segment if it holds the newest ids (full exports are
+        # written newest-first), so segment id ranges stay tight for window reads
+        if (
+            first_open
+            and tail is not None
+            and tail["lines"] < self.store.max_segment_lines
+            and tail.get("last_id") == self.store.last_id
+        ):
+            # Drop any bytes a failed run left past the committed size
+            path = os.path.join(self.store.root_dir, tail["file"])
+            self._file = open(path, "r+b")
+            self._file.truncate(tail["bytes"])
+            self._file.seek(tail["bytes"])
+            self._tail_committed_bytes = tail["bytes"]
+            self._tail_entry = self._entry = dict(tail)
+            return
+        number = len(segments) + len(self._new_entries) + 1
+        name = f"seg_{number:06d}.jsonl"
+        self._file = open(os.path.join(self.store.root_dir, name), "wb")
+        self._entry = {"file": name, "first_id": None, "last_id": None, "first_date": None,
+                       "last_date": None, "lines": 0, "bytes": 0}
+        self._new_entries.append(self._entry)
+
+    def write_batch(self, batch: Dict[str, Any]) -> None:
+        """
+        Append one clean_history_batch() result.
+
+        Args:
+            batch: Dict with `records` (JSON lines), `count`, `min_id`, `max_id`,
+                `min_date`, `max_date` of the stored lines.
+        """
+        if not batch["count"]:
+            return
+        if self._entry is None or self._entry["lines"] >= self.store.max_segment_lines:
+            self._close_segment()
+            self._open_segment()
+        data = (batch["records"] + "\n").encode("utf-8")
+        self._file.write(data)
+        entry = self._entry
+        entry["lines"] += batch["count"]
+        entry["bytes"] += len(data)
+        for key, value, pick in (("first_id", batch["min_id"], min), ("last_id", batch["max_id"], max),
+                                 ("first_date", batch["min_date"], min), ("last_date", batch["max_date"], max)):
+            if value is not None:
+                entry[key] = value if entry[key] is None else pick(entry[key], value)
+        self.lines_written += batch["count"]
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._entry = None
+
+    def commit(self) -> None:
+        self._close_segment()
+        if self._tail_entry is not None:
+            self.store.segments[-1] = self._tail_entry
+        self.store.segments.extend(self._new_entries)
+        self.store._write_index()
+        logger.info(f"Appended {self.lines_written} lines to {self.store.root_dir} ({len(self.store.segments)} segment(s))")
+
+    def rollback(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tail_entry is not None:
+            with open(os.path.join(self.store.root_dir, self._tail_entry["file"]), "r+b") as f:
+                f.truncate(self._tail_committed_bytes)
+        for entry in self._new_entries:
+            try:
+                os.remove(os.path.join(self.store.root_dir, entry["file"]))
+            except FileNotFoundError:
+                pass
+        logger.warning(f"Rolled back append to {self.store.root_dir}")
+
+def chat_output_dir(monitored_chat_id: int) -> str:
+    """
+    Working directory of a monitored chat's runs under TDL_OUTPUT_DIR_BASE.
+
+    Keyed by the MonitoredChat id, like the in-flight lease and the watermark, so two
+    users monitoring the same Telegram chat never share exports, stores or summaries.
+    """
+    from config import settings
+
+    return os.path.join(settings.TDL_OUTPUT_DIR_BASE, f"monitored_chat_{monitored_chat_id}")
+
+def get_segment_store(monitored_chat_id: int) -> SegmentStore:
+    """
+    Open the segment store of a monitored chat.
+    """
+    from config import settings
+
+    return SegmentStore(os.path.join(chat_output_dir(monitored_chat_id), "segments"), settings.SEGMENT_MAX_LINES)
+
+# --- Pytest skeleton ---
+
+"""
+from app.worker.segment_store import SegmentStore
+
+def _batch(ids, date=1700000000):
+    import json
+    records = "\\n".join(json.dumps({"id": i, "date": date + i, "text": f"m{i}"}) for i in ids)
+    return {"records": records, "count": len(ids), "min_id": min(ids), "max_id": max(ids),
+            "min_date": date + min(ids), "max_date": date + max(ids)}
+
+def test_append_and_read_window(tmp_path):
+    store = SegmentStore(str(tmp_path), max_segment_lines=3)
+    with store.appender() as app:
+        app.write_batch(_batch([3, 2, 1]))
+        app.write_batch(_batch([5, 4]))
+    store = SegmentStore(str(tmp_path), max_segment_lines=3)
+    assert store.last_id == 5 and len(store.segments) == 2
+    assert [r[0] for r in store.read_window(min_id=4)] == [4, 5]
+
+def test_failed_append_is_rolled_back(tmp_path):
+    store = SegmentStore(str(tmp_path), max_segment_lines=10)
+    with store.appender() as app:
+        app.write_batch(_batch([1]))
+    try:
+        with store.appender() as app:
+            app.write_batch(_batch([2]))
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert [r[0] for r in SegmentStore(str(tmp_path), 10).read_window()] == [1]
+"""
@@ -4,28 +4,305 @@ import asyncio
 import logging
 import os
 import json
-from typing import Optional, Any
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextvars import ContextVar
+from typing import Optional, Any, Awaitable, Callable, Deque, Iterable, Iterator, List, Tuple
+
+from rq import Queue, get_current_job
 
 from app.shared.database import async_sessionmaker
-from app.shared.db_crud import get_monitored_chat, get_all_monitored_chats_for_user
-from app.worker.tdl_executor import execute_tdl_command, TdlExecutionError
-from app.worker.text_cleaner import clean_tdl_message_text
+from app.shared.db_crud import get_monitored_chat, get_all_monitored_chats_for_user, advance_last_processed_message_id
+from app.worker.tdl_executor import TdlExecutionError
+from app.worker.tdl_governor import execute_governed_tdl_command
+from app.worker.text_cleaner import clean_history_batch
+from app.worker.clean_pool import get_clean_pool, clean_pool_workers
+from app.worker.segment_store import SegmentStore, chat_output_dir, get_segment_store
+from app.worker.dedup import dedup_lines
+from app.worker.history_reader import iter_tdl_messages
 from app.worker.llm_service import get_llm_summary
-from app.shared.redis_client import get_redis_sync
+from app.shared.redis_client import get_redis_async
+from app.worker.runtime import get_runtime
+from app.worker.coalescing import ChatRunLease, chat_job_id, claim_chat_runs, release_chat_run
+from app.worker.lanes import queue_for_run, record_queue_wait
 
 logger = logging.getLogger("telegram_insight_agent.worker.tasks")
 
-def _publish_status(request_id: str, status: str, detail: Optional[Any] = None) -> None:
+PROCESS_MONITORED_CHAT_FUNC = "app.worker.tasks.process_monitored_chat"
+
+NO_NEW_MESSAGES_SUMMARY = "No new messages since the last run."
+
+TERMINAL_STATUSES = ("SUCCESS", "FAILED")
+
+# Cleaning, file I/O and Redis round trips on top of the bounded stages
+_JOB_TIMEOUT_MARGIN_SEC = 300
+
+# In-flight lease of the run being processed in this context (see app.worker.coalescing)
+_current_lease: ContextVar[Optional[ChatRunLease]] = ContextVar("_current_lease", default=None)
+
+# Id of the run being processed in this context; sent with its events as `run_id`
+_current_run_id: ContextVar[Optional[str]] = ContextVar("_current_run_id", default=None)
+
+def run_id_for(monitored_chat_db_id: int, request_id: Optional[str]) -> str:
+    """
+    Run id for a job's events: the request_id of a manual run, else one per chat.
+
+    A chat has at most one run in flight, so scheduled runs of different chats get
+    different ids while each run's events share one (see app.userbot.dispatcher).
     """
-    Publish a job status update to Redis Pub/Sub.
+    return request_id or f"scheduled-{monitored_chat_db_id}"
+
+async def _publish_status(request_id: str, status: str, detail: Optional[Any] = None) -> None:
+    """
+    Append a job status event to the job events stream (JOB_EVENTS_STREAM).
+
+    The stream is trimmed to about JOB_EVENTS_MAXLEN entries; the userbot reads it through
+    a consumer group, so events published while it is down are delivered when it returns.
+    Uses the async client: in async mode many jobs share the event loop, and one stalled
+    blocking call would hold up all of them.
     """
-    redis = get_redis_sync()
-    key = f"request_status:{request_id}"
+    from config import settings
+
+    redis = get_redis_async()
     payload = {"status": status}
     if detail is not None:
         payload["detail"] = detail
-    logger.debug(f"Publishing status update: {payload} to {key}")
-    redis.publish(key, json.dumps(payload))
+    lease = _current_lease.get()
+    if lease is not None and status in TERMINAL_STATUSES:
+        # Requests that attached to this run share its result
+        attached = await lease.finish()
+        if attached:
+            payload["detail"] = {**(detail or {}), "attached_request_ids": attached}
+    logger.debug(f"Publishing status update for request_id={request_id}: {payload}")
+    entry = {"request_id": str(request_id), "data": json.dumps(payload)}
+    run_id = _current_run_id.get()
+    if run_id:
+        entry["run_id"] = run_id
+    await redis.xadd(
+        settings.JOB_EVENTS_STREAM,
+        entry,
+        maxlen=settings.JOB_EVENTS_MAXLEN,
+        approximate=True,
+    )
+
+def monitoring_job_timeout() -> int:
+    """
+    RQ job timeout for a monitoring run.
+
+    RQ_JOB_TIMEOUT_SEC if set; otherwise long enough for both tdl exports, including the
+    governor's acquire timeout for each, plus the LLM stage, so the job is never killed
+    before those timeouts can take effect.
+    """
+    from config import settings
+
+    if settings.RQ_JOB_TIMEOUT_SEC > 0:
+        return settings.RQ_JOB_TIMEOUT_SEC
+    tdl_sec = settings.TDL_HISTORY_TIMEOUT_SEC + settings.TDL_PARTICIPANTS_TIMEOUT_SEC
+    if settings.TDL_GOVERNOR_ENABLED:
+        tdl_sec += 2 * settings.TDL_ACQUIRE_TIMEOUT_SEC
+    return int(tdl_sec + settings.LLM_STAGE_TIMEOUT_SEC + _JOB_TIMEOUT_MARGIN_SEC)
+
+def _progress_publisher(request_id: Optional[str], stage: str) -> Optional[Callable[[dict], Awaitable[None]]]:
+    """
+    Build an on_progress callback that publishes PROGRESS events for a tdl stage.
+
+    Events are rate-limited to one per TDL_PROGRESS_MIN_INTERVAL_SEC (tdl redraws its
+    progress several times a second), except that completion is always published.
+    """
+    from config import settings
+
+    if not request_id:
+        return None
+    last_published = [0.0]
+
+    async def on_progress(event: dict) -> None:
+        now = time.monotonic()
+        if now - last_published[0] < settings.TDL_PROGRESS_MIN_INTERVAL_SEC and event.get("percent") != 100.0:
+            return
+        last_published[0] = now
+        await _publish_status(request_id, "PROGRESS", {"stage": stage, **event})
+
+    return on_progress
+
+def _build_history_export_args(chat_id: int, output_path: str, last_processed_message_id: Optional[int]) -> List[str]:
+    """
+    Build the tdl history export arguments for a chat.
+
+    With a watermark, only messages newer than it are exported (`-T id -i <from>`); tdl
+    fills in the upper bound, which makes it start from the latest message. An explicit
+    bound is sent to Telegram as an int32 offset after tdl adds 1, so 2**31-1 would wrap
+    to a negative offset. Without a watermark (first run or after a reset) the full
+    history is exported.
+    """
+    args = ["chat", "export", "-c", str(chat_id), "--all", "--with-content"]
+    if last_processed_message_id:
+        args += ["-T", "id", "-i", str(last_processed_message_id + 1)]
+    args += ["-o", output_path]
+    return args
+
+def _iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _clean_history_export(history_json_path: str, store: SegmentStore, full_export: bool, stats: Optional[dict] = None) -> Tuple[int, int, Optional[int]]:
+    """
+    Stream a tdl export through the cleaner and append the cleaned lines to the chat's segment store.
+
+    A full export replaces the store; an incremental one only appends messages newer
+    than what the store already holds (a failed run may have stored them already).
+
+    Small exports are cleaned inline. Once more than CLEAN_PARALLEL_THRESHOLD messages
+    have been read, the remaining chunks go to the cleaning process pool; results are
+    written in submission order, so the output is identical to the serial path. At most
+    two chunks per pool worker are in flight, which bounds memory.
+
+    Args:
+        history_json_path: tdl export file.
+        store: The chat's segment store.
+        full_export: Whether the export holds the whole history.
+        stats: Optional dict that receives `mode`, `workers`, `msgs_per_sec`.
+
+    Returns:
+        (messages read, lines appended, highest message id seen or None).
+    """
+    from config import settings
+
+    message_count = 0
+    max_message_id = None
+    pool = None
+    pending: Deque[Future] = deque()
+    max_pending = 0
+    started = time.perf_counter()
+    if full_export:
+        store.reset()
+    skip_through_id = store.last_id
+
+    def write_result(result: dict) -> None:
+        nonlocal max_message_id
+        batch_max_id = result["max_message_id"]
+        if batch_max_id is not None and (max_message_id is None or batch_max_id > max_message_id):
+            max_message_id = batch_max_id
+        appender.write_batch(result)
+
+    with store.appender() as appender:
+        try:
+            for batch in _iter_batches(iter_tdl_messages(history_json_path), settings.CLEAN_CHUNK_SIZE):
+                message_count += len(batch)
+                if pool is None:
+                    write_result(clean_history_batch(batch, skip_through_id))
+                    if (
+                        settings.CLEAN_PARALLEL_ENABLED
+                        and message_count > settings.CLEAN_PARALLEL_THRESHOLD
+                        and clean_pool_workers() > 1
+                    ):
+                        pool = get_clean_pool()
+                        max_pending = 2 * clean_pool_workers()
+                        logger.info(f"Export passed {settings.CLEAN_PARALLEL_THRESHOLD} messages, switching to parallel cleaning")
+                    continue
+                pending.append(pool.submit(clean_history_batch, batch, skip_through_id))
+                while len(pending) >= max_pending:
+                    write_result(pending.popleft().result())
+            while pending:
+                write_result(pending.popleft().result())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    elapsed = time.perf_counter() - started
+    if stats is not None:
+        stats["mode"] = "parallel" if pool is not None else "serial"
+        stats["workers"] = clean_pool_workers() if pool is not None else 1
+        stats["msgs_per_sec"] = round(message_count / elapsed) if elapsed > 0 else None
+    return message_count, appender.lines_written, max_message_id
+
+def _write_llm_input(store: SegmentStore, cleaned_txt_path: str, watermark: Optional[int], dedup_threshold: Optional[int], stats: Optional[dict] = None) -> int:
+    """
+    Write the LLM input window from the segment store to history_cleaned.txt.
+
+    With SUMMARY_WINDOW_HOURS set, the window is the last N hours of stored history;
+    otherwise it is everything after the previous run's watermark (all of it on a full run).
+    Near-duplicate lines are then collapsed unless dedup is off for the chat.
+
+    Args:
+        store: The chat's segment store.
+        cleaned_txt_path: Output file.
+        watermark: The previous run's watermark.
+        dedup_threshold: The chat's threshold (None = DEDUP_DEFAULT_THRESHOLD, <0 = off).
+        stats: Optional dict that receives the dedup stats.
+
+    Returns:
+        Number of lines written.
+    """
+    from config import settings
+
+    if settings.SUMMARY_WINDOW_HOURS > 0:
+        since_ts = int(time.time()) - int(settings.SUMMARY_WINDOW_HOURS * 3600)
+        records = store.read_window(since_ts=since_ts)
+    else:
+        records = store.read_window(min_id=watermark + 1 if watermark else None)
+    lines = [line for _, _, line in records]
+    if dedup_threshold is None:
+        dedup_threshold = settings.DEDUP_DEFAULT_THRESHOLD
+    if settings.DEDUP_ENABLED and dedup_threshold >= 0:
+        lines, dedup_stats = dedup_lines(lines, dedup_threshold)
+        if stats is not None:
+            stats.update(dedup_stats)
+    with open(cleaned_txt_path, "w", encoding="utf-8") as out:
+        out.write("\n".join(lines))
+    return len(lines)
+
+async def _export_participants(chat_id: int, output_dir: str, request_id: Optional[str], timings: dict) -> Optional[str]:
+    """
+    Export a chat's participants to participants.txt. Optional stage: never raises.
+
+    Returns:
+        Path to participants.txt, or None if the export failed.
+    """
+    from config import settings
+
+    participants_json_path = os.path.join(output_dir, "participants.json")
+    participants_txt_path = os.path.join(output_dir, "participants.txt")
+    stage_started = time.perf_counter()
+    try:
+        await _publish_status(request_id, "TDL_PARTICIPANTS_EXPORT")
+        governor_stats = {}
+        await execute_governed_tdl_command(
+            ["chat", "users", "-c", str(chat_id), "-o", participants_json_path],
+            timeout_sec=settings.TDL_PARTICIPANTS_TIMEOUT_SEC,
+            stats=governor_stats,
+            on_progress=_progress_publisher(request_id, "TDL_PARTICIPANTS_EXPORT"),
+        )
+        timings["participants_queue_sec"] = governor_stats.get("queue_wait_sec", 0.0)
+        with open(participants_json_path, "r", encoding="utf-8") as f:
+            participants_data = json.load(f)
+        with open(participants_txt_path, "w", encoding="utf-8") as f2:
+            for user in participants_data.get("users", []):
+                line = f"{user.get('id')} {user.get('username') or ''} {user.get('first_name') or ''} {user.get('last_name') or ''}\n"
+                f2.write(line)
+        return participants_txt_path
+    except asyncio.CancelledError:
+        logger.info(f"Participants export cancelled for chat_id={chat_id}")
+        raise
+    except Exception as e:
+        logger.warning(f"Participants export failed: {e}")
+        await _publish_status(request_id, "TDL_PARTICIPANTS_EXPORT_FAILED", {"error": str(e)})
+        return None
+    finally:
+        timings["participants_export_sec"] = round(time.perf_counter() - stage_started, 3)
+
+async def _cancel_and_wait(task: "asyncio.Task[Any]") -> None:
+    """
+    Cancel a task and wait until it has finished, so its tdl subprocess is gone.
+    """
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
 
 def process_monitored_chat(monitored_chat_db_id: int, request_id: Optional[str] = None, is_manual_run: bool = False) -> None:
     """
@@ -40,11 +317,32 @@ def process_monitored_chat(monitored_chat_db_id: int, request_id: Optional[str]
         None
     """
     logger.info(f"process_monitored_chat called: chat_db_id={monitored_chat_db_id}, request_id={request_id}, manual={is_manual_run}")
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(_process(monitored_chat_db_id, request_id, is_manual_run))
+    queue_stats = record_queue_wait(get_current_job())
+    get_runtime().run(_process(monitored_chat_db_id, request_id, is_manual_run, queue_stats))
+
+async def _process(monitored_chat_db_id: int, request_id: Optional[str], is_manual_run: bool, queue_stats: Optional[dict] = None) -> None:
+    """
+    Run the pipeline for a chat unless another run for it is already in flight.
+    """
+    lease = ChatRunLease(monitored_chat_db_id, request_id)
+    if not await lease.start():
+        return
+    run_token = _current_run_id.set(run_id_for(monitored_chat_db_id, request_id))
+    context_token = _current_lease.set(lease)
+    try:
+        async with lease.held():
+            await _process_chat(monitored_chat_db_id, request_id, is_manual_run, queue_stats)
+    finally:
+        _current_lease.reset(context_token)
+        try:
+            # Only non-empty if the run ended without a terminal status (e.g. cancelled)
+            attached = await lease.finish()
+            if attached:
+                await _publish_status(request_id, "FAILED", {"error": "Run ended without a result", "attached_request_ids": attached})
+        finally:
+            _current_run_id.reset(run_token)
 
-async def _process(monitored_chat_db_id: int, request_id: Optional[str], is_manual_run: bool) -> None:
+async def _process_chat(monitored_chat_db_id: int, request_id: Optional[str], is_manual_run: bool, queue_stats: Optional[dict] = None) -> None:
     from app.shared.db_models import MonitoredChat
     from config import settings
 
@@ -53,79 +351,126 @@ async def _process(monitored_chat_db_id: int, request_id: Optional[str], is_manu
             mc = await session.get(MonitoredChat, monitored_chat_db_id)
             if not mc:
                 logger.error(f"MonitoredChat not found: id={monitored_chat_db_id}")
-                _publish_status(request_id, "FAILED", {"error": "MonitoredChat not found"})
+                await _publish_status(request_id, "FAILED", {"error": "MonitoredChat not found"})
                 return
-            _publish_status(request_id, "STARTED")
-            output_dir = os.path.join(settings.TDL_OUTPUT_DIR_BASE, f"chat_{mc.chat_id}")
+            # End the read transaction so the pooled connection is not held for the whole
+            # run (many runs share one process's pool); mc stays loaded (expire_on_commit=False)
+            await session.commit()
+            await _publish_status(request_id, "STARTED")
+            run_started = time.perf_counter()
+            # Lane and time spent waiting in it (see app.worker.lanes)
+            timings = dict(queue_stats or {})
+            output_dir = chat_output_dir(mc.id)
             os.makedirs(output_dir, exist_ok=True)
             history_json_path = os.path.join(output_dir, "history.json")
-            participants_json_path = os.path.join(output_dir, "participants.json")
-            # Step 1: History export
-            history_args = ["chat", "export", "-c", str(mc.chat_id), "--all", "-o", history_json_path]
+            # Step 1: History export. tdl holds an exclusive lock on the account's session
+            # storage, so the participants export only starts once this one has finished.
+            watermark = mc.last_processed_message_id
+            history_args = _build_history_export_args(mc.chat_id, history_json_path, watermark)
+            logger.info(f"History export mode: {'incremental from ' + str(watermark) if watermark else 'full'}")
             try:
-                _publish_status(request_id, "TDL_HISTORY_EXPORT")
-                await execute_tdl_command(history_args)
+                await _publish_status(request_id, "TDL_HISTORY_EXPORT")
+                stage_started = time.perf_counter()
+                governor_stats = {}
+                await execute_governed_tdl_command(
+                    history_args,
+                    timeout_sec=settings.TDL_HISTORY_TIMEOUT_SEC,
+                    stats=governor_stats,
+                    on_progress=_progress_publisher(request_id, "TDL_HISTORY_EXPORT"),
+                )
+                timings["history_queue_sec"] = governor_stats.get("queue_wait_sec", 0.0)
+                timings["history_export_sec"] = round(time.perf_counter() - stage_started, 3)
             except Exception as e:
                 logger.error(f"tdl export failed: {e}")
-                _publish_status(request_id, "FAILED", {"error": f"tdl export failed: {e}", "user_id": mc.user_id, "chat_id": mc.chat_id, "chat_title": mc.chat_title})
+                await _publish_status(request_id, "FAILED", {"error": f"tdl export failed: {e}", "user_id": mc.user_id, "chat_id": mc.chat_id, "chat_title": mc.chat_title})
                 return
-            # Step 2: Clean messages
-            with open(history_json_path, "r", encoding="utf-8") as f:
-                history_data = json.load(f)
-            cleaned_lines = []
-            for msg in history_data.get("messages", []):
-                cleaned = clean_tdl_message_text(msg)
-                if cleaned:
-                    cleaned_lines.append(cleaned)
-            cleaned_history = "\n".join(cleaned_lines)
+            # Step 2: Participants export (optional: a failure is reported but never fails
+            # the run), overlapping with cleaning only the exported messages into the
+            # chat's segment store and reading the LLM input window back from it
+            participants_task = asyncio.create_task(
+                _export_participants(mc.chat_id, output_dir, request_id, timings)
+            )
             cleaned_txt_path = os.path.join(output_dir, "history_cleaned.txt")
-            with open(cleaned_txt_path, "w", encoding="utf-8") as f:
-                f.write(cleaned_history)
-            # Step 3: Participants export (optional)
+            store = get_segment_store(mc.id)
+            clean_stats = {}
+            dedup_stats = {}
+            stage_started = time.perf_counter()
             try:
-                _publish_status(request_id, "TDL_PARTICIPANTS_EXPORT")
-                await execute_tdl_command(["chat", "users", "-c", str(mc.chat_id), "-o", participants_json_path])
-                with open(participants_json_path, "r", encoding="utf-8") as f:
-                    participants_data = json.load(f)
-                participants_txt_path = os.path.join(output_dir, "participants.txt")
-                with open(participants_txt_path, "w", encoding="utf-8") as f2:
-                    for user in participants_data.get("users", []):
-                        line = f"{user.get('id')} {user.get('username') or ''} {user.get('first_name') or ''} {user.get('last_name') or ''}\n"
-                        f2.write(line)
-            except Exception as e:
-                participants_txt_path = None
-                logger.warning(f"Participants export failed: {e}")
-                _publish_status(request_id, "TDL_PARTICIPANTS_EXPORT_FAILED", {"error": str(e)})
+                # In a thread, so the participants export keeps being serviced meanwhile
+                message_count, cleaned_count, max_message_id = await asyncio.to_thread(
+                    _clean_history_export, history_json_path, store, not watermark, clean_stats
+                )
+                window_lines = await asyncio.to_thread(
+                    _write_llm_input, store, cleaned_txt_path, watermark, mc.dedup_threshold, dedup_stats
+                )
+            except BaseException:
+                await _cancel_and_wait(participants_task)
+                raise
+            timings["clean_sec"] = round(time.perf_counter() - stage_started, 3)
+            timings["clean_msgs_per_sec"] = clean_stats.get("msgs_per_sec")
+            logger.info(
+                f"Cleaned {cleaned_count}/{message_count} new messages into {store.root_dir} "
+                f"({clean_stats.get('mode')}, {clean_stats.get('msgs_per_sec')} msg/s); "
+                f"LLM window has {window_lines} lines"
+            )
+            if request_id:
+                await _publish_status(request_id, "PROGRESS", {"stage": "CLEANING", "done": message_count, **clean_stats})
+            # Step 3: Wait for the participants export (if still running)
+            participants_txt_path = await participants_task
+            timings["exports_wall_sec"] = round(time.perf_counter() - run_started, 3)
 
             # Step 4: LLM summarization
+            llm_stats = {}
             try:
-                _publish_status(request_id, "CALLING_LLM")
-                summary = await get_llm_summary(cleaned_history, mc.prompt)
+                if watermark and not message_count:
+                    logger.info(f"No new messages past watermark {watermark}, skipping LLM call")
+                    summary = NO_NEW_MESSAGES_SUMMARY
+                else:
+                    await _publish_status(request_id, "CALLING_LLM")
+                    with open(cleaned_txt_path, "r", encoding="utf-8") as f:
+                        cleaned_history = f.read()
+                    stage_started = time.perf_counter()
+                    summary = await asyncio.wait_for(
+                        get_llm_summary(cleaned_history, mc.prompt, stats=llm_stats),
+                        timeout=settings.LLM_STAGE_TIMEOUT_SEC,
+                    )
+                    timings["llm_sec"] = round(time.perf_counter() - stage_started, 3)
                 summary_txt_path = os.path.join(output_dir, "summary.txt")
                 with open(summary_txt_path, "w", encoding="utf-8") as fs:
                     fs.write(summary)
             except Exception as e:
-                logger.error(f"LLM failed: {e}")
-                _publish_status(request_id, "FAILED", {
-                    "error": f"LLM failed: {e}",
+                error = f"timed out after {settings.LLM_STAGE_TIMEOUT_SEC}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+                logger.error(f"LLM failed: {error}")
+                await _publish_status(request_id, "FAILED", {
+                    "error": f"LLM failed: {error}",
                     "user_id": mc.user_id,
                     "chat_id": mc.chat_id,
                     "chat_title": mc.chat_title
                 })
                 return
 
-            # Step 5: Success - publish all paths and metadata
-            _publish_status(request_id, "SUCCESS", {
+            # Step 5: Advance the watermark only once the run has fully succeeded
+            if max_message_id is not None:
+                await advance_last_processed_message_id(session, mc.id, max_message_id)
+
+            # Step 6: Success - publish all paths and metadata
+            timings["total_sec"] = round(time.perf_counter() - run_started, 3)
+            logger.info(f"Run timings for chat_id={mc.chat_id}: {timings}")
+            await _publish_status(request_id, "SUCCESS", {
                 "user_id": mc.user_id,
                 "chat_id": mc.chat_id,
                 "chat_title": mc.chat_title,
                 "summary_path": summary_txt_path,
                 "participants_path": participants_txt_path,
                 "history_path": cleaned_txt_path,
+                "last_processed_message_id": max_message_id if max_message_id is not None else watermark,
+                "llm": llm_stats,
+                "timings": timings,
+                "dedup": dedup_stats,
             })
     except Exception as e:
         logger.error(f"process_monitored_chat crashed: {e}")
-        _publish_status(request_id, "FAILED", {"error": str(e)})
+        await _publish_status(request_id, "FAILED", {"error": str(e)})
 
 def periodic_monitoring_check(user_telegram_id: int) -> None:
     """
@@ -138,9 +483,7 @@ def periodic_monitoring_check(user_telegram_id: int) -> None:
         None
     """
     logger.info(f"periodic_monitoring_check called for user_id={user_telegram_id}")
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(_periodic_check(user_telegram_id))
+    get_runtime().run(_periodic_check(user_telegram_id))
 
 async def _periodic_check(user_telegram_id: int) -> None:
     """
@@ -149,32 +492,112 @@ async def _periodic_check(user_telegram_id: int) -> None:
     try:
         async with async_sessionmaker() as session:
             chats = await get_all_monitored_chats_for_user(session, user_telegram_id)
-            from app.shared.redis_client import get_rq_queue
-            rq_queue = get_rq_queue()
-            for mc in chats:
-                if mc.is_active:
-                    rq_queue.enqueue("app.worker.tasks.process_monitored_chat", mc.id, is_manual_run=False)
-                    logger.info(f"Enqueued process_monitored_chat for chat_id={mc.id} (user_id={user_telegram_id})")
+        count = enqueue_monitoring_runs([mc.id for mc in chats if mc.is_active])
+        logger.info(f"Enqueued process_monitored_chat for {count} chat(s) (user_id={user_telegram_id})")
     except Exception as e:
         logger.error(f"periodic_monitoring_check crashed: {e}")
 
+def enqueue_monitoring_runs(monitored_chat_ids: List[int], is_manual_run: bool = False) -> int:
+    """
+    Enqueue process_monitored_chat for many chats in a single Redis pipeline.
+
+    Chats that already have a run queued or in flight are skipped.
+
+    Args:
+        monitored_chat_ids: MonitoredChat row ids.
+        is_manual_run: Passed through to every job.
+
+    Returns:
+        Number of jobs enqueued.
+    """
+    from app.shared.redis_client import get_rq_queue
+    # Chats with a run already queued or running are skipped (see app.worker.coalescing)
+    monitored_chat_ids = claim_chat_runs(monitored_chat_ids)
+    if not monitored_chat_ids:
+        return 0
+    job_timeout = monitoring_job_timeout()
+    job_datas = [
+        Queue.prepare_data(
+            PROCESS_MONITORED_CHAT_FUNC,
+            args=(mc_id,),
+            kwargs={"is_manual_run": is_manual_run},
+            timeout=job_timeout,
+            job_id=chat_job_id(mc_id),
+        )
+        for mc_id in monitored_chat_ids
+    ]
+    try:
+        jobs = get_rq_queue(queue_for_run(is_manual_run)).enqueue_many(job_datas)
+    except Exception:
+        for mc_id in monitored_chat_ids:
+            release_chat_run(mc_id)
+        raise
+    return len(jobs)
+
 # --- Pytest skeleton ---
 
 """
+import json
 import pytest
 from unittest.mock import patch, AsyncMock
 from app.worker import tasks
 
-def test_publish_status(monkeypatch):
-    monkeypatch.setattr(tasks, "get_redis_sync", lambda: type("R", (), {"publish": lambda self, k, v: None})())
-    tasks._publish_status("reqid", "STATUS", {"x": 1})
+@pytest.mark.asyncio
+async def test_publish_status(monkeypatch):
+    redis = AsyncMock()
+    monkeypatch.setattr(tasks, "get_redis_async", lambda: redis)
+    await tasks._publish_status("reqid", "STATUS", {"x": 1})
+    redis.xadd.assert_awaited_once()
 
 def test_process_monitored_chat_importable():
     assert callable(tasks.process_monitored_chat)
 
+def test_enqueue_monitoring_runs_uses_one_bulk_call(monkeypatch):
+    queue = type("Q", (), {"enqueue_many": lambda self, datas: list(datas)})()
+    monkeypatch.setattr("app.shared.redis_client.get_rq_queue", lambda name: queue)
+    monkeypatch.setattr(tasks, "claim_chat_runs", lambda ids: list(ids))
+    assert tasks.enqueue_monitoring_runs([1, 2, 3]) == 3
+    assert tasks.enqueue_monitoring_runs([]) == 0
+
+def test_clean_history_export_parallel_matches_serial(tmp_path, monkeypatch):
+    from config import settings
+    from app.worker.clean_pool import shutdown_clean_pool
+    from app.worker.segment_store import SegmentStore
+
+    messages = [
+        {"id": i, "type": "message", "date": 1700000000 + i * 60, "text": f"message {i % 7} number {i}"}
+        for i in range(500, 0, -1)
+    ]
+    export_path = tmp_path / "history.json"
+    export_path.write_text(json.dumps({"id": 1, "messages": messages}), encoding="utf-8")
+    monkeypatch.setattr(settings, "CLEAN_CHUNK_SIZE", 50)
+    monkeypatch.setattr(settings, "CLEAN_PARALLEL_WORKERS", 2)
+    outputs = {}
+    try:
+        for mode, enabled in (("parallel", True), ("serial", False)):
+            monkeypatch.setattr(settings, "CLEAN_PARALLEL_ENABLED", enabled)
+            monkeypatch.setattr(settings, "CLEAN_PARALLEL_THRESHOLD", 0)
+            stats = {}
+            store = SegmentStore(str(tmp_path / mode), max_segment_lines=120)
+            tasks._clean_history_export(str(export_path), store, full_export=True, stats=stats)
+            assert stats["mode"] == mode
+            outputs[mode] = {p.name: p.read_bytes() for p in sorted((tmp_path / mode).iterdir())}
+    finally:
+        shutdown_clean_pool()
+    assert len(outputs["serial"]) > 2  # several segments plus the index
+    assert outputs["parallel"] == outputs["serial"]
+
+def test_build_history_export_args_full():
+    args = tasks._build_history_export_args(123, "/tmp/h.json", None)
+    assert "-T" not in args and args[-2:] == ["-o", "/tmp/h.json"]
+
+def test_build_history_export_args_incremental():
+    args = tasks._build_history_export_args(123, "/tmp/h.json", 41)
+    assert args[args.index("-i") + 1] == "42"
+
 @pytest.mark.asyncio
 async def test__process_handles_missing_mc(monkeypatch):
     async def fake_get(*a, **kw): return None
     monkeypatch.setattr(tasks, "async_sessionmaker", lambda: type("S", (), {"__aenter__": lambda s: s, "__aexit__": lambda *a, **k: None, "get": fake_get})())
-    await tasks._process(1, "reqid", False)
+    await tasks._process_chat(1, "reqid", False)
 """
\ No newline at end of file
@@ -1,34 +1,152 @@
 import asyncio
+import inspect
 import json
 import logging
 import os
-from typing import Any, Dict, List
+import re
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Union
 
 from config import settings
 
 logger = logging.getLogger("telegram_insight_agent.tdl_executor")
 
+_READ_CHUNK_SIZE = 4096
+_MAX_LINE_CHARS = 1000
+_LINE_SPLIT_RE = re.compile(r"[\r\n]")
+_ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_COUNT_RE = r"(\d[\d,]*(?:\.\d+)?[KMBT]?)"
+_DONE_TOTAL_RE = re.compile(_COUNT_RE + r"\s*/\s*" + _COUNT_RE)
+_TRACKER_VALUE_RE = re.compile(r"\.\.\.\s*(?:\[[^\]]*\]\s*)?" + _COUNT_RE + r"(?:\s|$)")
+_UNIT_MULTIPLIERS = {"K": 1e3, "M": 1e6, "B": 1e9, "T": 1e12}
+
+# on_progress callback: a plain function, or one returning a coroutine to await
+ProgressCallback = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
 class TdlExecutionError(Exception):
     """Raised when tdl subprocess fails or output is invalid."""
     pass
 
-async def execute_tdl_command(args: List[str], timeout_sec: int = 300) -> Dict[str, Any]:
+def _parse_count(value: str) -> int:
+    value = value.replace(",", "")
+    multiplier = _UNIT_MULTIPLIERS.get(value[-1], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+def parse_tdl_progress(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse one rendered tdl progress line (go-pretty tracker output).
+
+    Tracker lines look like `<chat>-<id> ... 1.2K` (unknown total, e.g. `chat export`)
+    or `<chat>-<id>-users ... 45.0% [###....] 123 / 456` (known total, `chat users`).
+
+    Args:
+        line: Raw output line, possibly containing ANSI escapes.
+
+    Returns:
+        Dict with any of `percent`, `done`, `total`, or None if the line is not progress.
+    """
+    line = _ANSI_RE.sub("", line).strip()
+    if not line:
+        return None
+    event: Dict[str, Any] = {}
+    match = _DONE_TOTAL_RE.search(line)
+    if match:
+        event["done"] = _parse_count(match.group(1))
+        event["total"] = _parse_count(match.group(2))
+    else:
+        match = _TRACKER_VALUE_RE.search(line)
+        if match:
+            event["done"] = _parse_count(match.group(1))
+    match = _PERCENT_RE.search(line)
+    if match:
+        event["percent"] = float(match.group(1))
+    elif event.get("total"):
+        event["percent"] = round(100.0 * event["done"] / event["total"], 1)
+    return event or None
+
+def _output_path_from_args(args: List[str]) -> Optional[str]:
+    for flag in ("-o", "--output"):
+        if flag in args and args.index(flag) + 1 < len(args):
+            return args[args.index(flag) + 1]
+    return None
+
+async def _pump_lines(
+    stream: asyncio.StreamReader,
+    tail: Deque[str],
+    on_line: Optional[Callable[[str], Awaitable[None]]],
+) -> None:
+    """
+    Read a subprocess stream incrementally, splitting on \\r and \\n (progress redraws use \\r).
+
+    Only the last lines are kept in `tail`, so memory stays bounded however much tdl prints.
     """
-    Executes a tdl CLI command as a subprocess and returns parsed JSON output.
+    pending = ""
+    while True:
+        chunk = await stream.read(_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        parts = _LINE_SPLIT_RE.split(pending + chunk.decode("utf-8", errors="replace"))
+        pending = parts.pop()[-_MAX_LINE_CHARS:]
+        for line in parts:
+            if not line:
+                continue
+            line = line[:_MAX_LINE_CHARS]
+            tail.append(line)
+            if on_line is not None:
+                await on_line(line)
+    if pending:
+        tail.append(pending)
+        if on_line is not None:
+            await on_line(pending)
+
+async def execute_tdl_command(
+    args: List[str],
+    timeout_sec: int = 300,
+    output_path: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Executes a tdl CLI command as a subprocess, streaming its output.
+
+    stdout/stderr are consumed line by line while tdl runs; only a bounded tail is kept
+    for error reporting. Commands that write an `-o` file produce that file as their
+    result; stdout is only parsed as JSON for commands without an output file.
 
     Args:
         args: Command arguments (e.g. ['chat', 'export', ...])
         timeout_sec: Max seconds to wait for completion.
+        output_path: Result file written by tdl (defaults to the `-o` argument, if any).
+        on_progress: Called with each parsed progress event (see parse_tdl_progress);
+            a coroutine it returns is awaited before more output is read.
 
     Returns:
-        Parsed JSON output from tdl.
+        {"output_path", "size_bytes"} for file-producing commands, else parsed JSON stdout.
 
     Raises:
-        TdlExecutionError: On nonzero exit, timeout, or JSON parsing error.
+        TdlExecutionError: On nonzero exit, timeout, missing output file or JSON parsing error.
     """
     tdl_bin = "tdl"
     env = os.environ.copy()
     env["TDL_CONFIG_DIR"] = settings.TDL_CONFIG_DIR
+    output_path = output_path or _output_path_from_args(args)
+    stdout_tail: Deque[str] = deque(maxlen=settings.TDL_OUTPUT_TAIL_LINES)
+    stderr_tail: Deque[str] = deque(maxlen=settings.TDL_OUTPUT_TAIL_LINES)
+
+    async def handle_line(line: str) -> None:
+        if on_progress is None:
+            return
+        event = parse_tdl_progress(line)
+        if event is not None:
+            try:
+                result = on_progress(event)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"tdl progress callback failed: {e}")
+
     logger.info(f"Executing tdl command: {tdl_bin} {' '.join(args)}")
     try:
         proc = await asyncio.create_subprocess_exec(
@@ -38,22 +156,45 @@ async def execute_tdl_command(args: List[str], timeout_sec: int = 300) -> Dict[s
             env=env
         )
         try:
-            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout_sec)
+            # tdl renders progress to stdout, logs and errors to stderr; watch both
+            await asyncio.wait_for(
+                asyncio.gather(
+                    _pump_lines(proc.stdout, stdout_tail, handle_line),
+                    _pump_lines(proc.stderr, stderr_tail, handle_line),
+                    proc.wait(),
+                ),
+                timeout=timeout_sec,
+            )
         except asyncio.TimeoutError:
-            proc.kill()
             logger.error(f"tdl command timed out: {tdl_bin} {' '.join(args)}")
             raise TdlExecutionError(f"tdl command timed out: {' '.join(args)}")
+        finally:
+            # Also reached on cancellation: never leave an orphaned tdl behind
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
 
         if proc.returncode != 0:
-            logger.error(f"tdl exited with {proc.returncode}: {stderr.decode().strip()}")
-            raise TdlExecutionError(f"tdl exited with {proc.returncode}: {stderr.decode().strip()}")
-
+            error_tail = "\n".join(stderr_tail or stdout_tail).strip()
+            logger.error(f"tdl exited with {proc.returncode}: {error_tail}")
+            raise TdlExecutionError(f"tdl exited with {proc.returncode}: {error_tail}")
+
+        if output_path is not None:
+            if not os.path.isfile(output_path):
+                raise TdlExecutionError(f"tdl did not write output file: {output_path}")
+            size_bytes = os.path.getsize(output_path)
+            logger.info(f"tdl wrote {output_path} ({size_bytes} bytes)")
+            return {"output_path": output_path, "size_bytes": size_bytes}
+
+        stdout_text = "\n".join(stdout_tail)
+        if len(stdout_tail) == stdout_tail.maxlen:
+            raise TdlExecutionError("tdl stdout exceeded the captured tail, cannot parse JSON result")
         try:
-            result = json.loads(stdout.decode())
+            result = json.loads(stdout_text)
             logger.debug(f"tdl command output parsed: {result}")
             return result
         except Exception as e:
-            logger.error(f"Failed to parse tdl output: {stdout.decode()} - {e}")
+            logger.error(f"Failed to parse tdl output: {stdout_text} - {e}")
             raise TdlExecutionError(f"Failed to parse tdl output: {e}")
     except Exception as e:
         logger.exception(f"Error running tdl command: {args} - {e}")
@@ -66,26 +207,32 @@ async def execute_tdl_command(args: List[str], timeout_sec: int = 300) -> Dict[s
 """
 import pytest
 import asyncio
-from app.worker.tdl_executor import execute_tdl_command, TdlExecutionError
+from app.worker.tdl_executor import execute_tdl_command, parse_tdl_progress, TdlExecutionError
+
+def test_parse_tdl_progress():
+    assert parse_tdl_progress("\\x1b[KChat-1 ... 1.2K")["done"] == 1200
+    event = parse_tdl_progress("Chat-1-users ... 45.0% [###...] 123 / 456")
+    assert event == {"done": 123, "total": 456, "percent": 45.0}
+    assert parse_tdl_progress("Type: id | Input: [1 2]") is None
 
 @pytest.mark.asyncio
 async def test_execute_tdl_command_success(monkeypatch):
     # monkeypatch asyncio.create_subprocess_exec to return a mock process
-    # with .communicate() returning valid JSON
+    # whose stdout/stderr StreamReaders are fed progress lines, and write the -o file
     pass
 
 @pytest.mark.asyncio
 async def test_execute_tdl_command_timeout(monkeypatch):
-    # Simulate timeout
+    # Simulate timeout; the process must be killed
     pass
 
 @pytest.mark.asyncio
 async def test_execute_tdl_command_nonzero_exit(monkeypatch):
-    # Simulate nonzero exit code and error output
+    # Simulate nonzero exit code; the error carries the stderr tail
     pass
 
 @pytest.mark.asyncio
-async def test_execute_tdl_command_json_error(monkeypatch):
-    # Simulate invalid JSON output
+async def test_execute_tdl_command_missing_output(monkeypatch):
+    # Simulate exit 0 without the -o file being written
     pass
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,332 @@
+# Cluster-wide concurrency and rate governor for tdl subprocesses
+
+"""
+Redis-backed limiter shared by every worker that drives the same Telegram account.
+
+Each tdl invocation must first take a slot in a per-account semaphore (a sorted set of
+leases that expire if a worker dies, renewed while the command runs) and then a token
+from a per-account token bucket. When tdl reports a FLOOD_WAIT, the bucket is paused
+for the whole cluster instead of every worker discovering the limit on its own.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.shared.redis_client import get_redis_async
+from app.worker.tdl_executor import ProgressCallback, execute_tdl_command, TdlExecutionError
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.tdl_governor")
+
+KEY_PREFIX = "tdl_gov:"
+_POLL_INTERVAL_SEC = 0.25
+_FLOOD_WAIT_RE = re.compile(r"FLOOD_WAIT[_ (]*(\d+)")
+
+# KEYS: semaphore zset. ARGV: limit, lease_ms, token. Returns 1 if the slot was taken.
+_SEMAPHORE_ACQUIRE_LUA = """
+local t = redis.call('TIME')
+local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now_ms)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now_ms + tonumber(ARGV[2]), ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS: semaphore zset. ARGV: lease_ms, token. Returns 0 if the lease was already lost.
+_SEMAPHORE_RENEW_LUA = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[2]) then
+    return 0
+end
+local t = redis.call('TIME')
+local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZADD', KEYS[1], now_ms + tonumber(ARGV[1]), ARGV[2])
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: bucket hash, pause key. ARGV: rate per second, burst.
+# Returns seconds to wait as a string (0 means a token was taken).
+_TOKEN_BUCKET_LUA = """
+local pause_ms = redis.call('PTTL', KEYS[2])
+if pause_ms > 0 then
+    return tostring(pause_ms / 1000)
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or burst)
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts') or now)
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+class TdlGovernorTimeout(TdlExecutionError):
+    """Raised when a tdl slot or rate token could not be obtained in time."""
+    pass
+
+class TdlGovernor:
+    """
+    Per-account distributed semaphore + token bucket for tdl commands, with wait metrics.
+    """
+
+    def __init__(
+        self,
+        account: str,
+        max_concurrency: int,
+        rate_per_sec: float,
+        burst: int,
+        lease_sec: float,
+        acquire_timeout_sec: float,
+    ) -> None:
+        self.account = account
+        self.max_concurrency = max_concurrency
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.lease_ms = int(lease_sec * 1000)
+        self.acquire_timeout_sec = acquire_timeout_sec
+        self.semaphore_key = f"{KEY_PREFIX}{account}:slots"
+        self.bucket_key = f"{KEY_PREFIX}{account}:bucket"
+        self.pause_key = f"{KEY_PREFIX}{account}:pause"
+        self.waiting_key = f"{KEY_PREFIX}{account}:waiting"
+        self.metrics: Dict[str, float] = {
+            "acquired": 0, "acquire_timeouts": 0, "flood_waits": 0, "lost_leases": 0,
+            "redis_errors": 0, "waiting": 0, "wait_sec_total": 0.0, "wait_sec_max": 0.0,
+        }
+
+    async def _try_acquire_slot(self, redis: Any, token: str) -> bool:
+        script = redis.register_script(_SEMAPHORE_ACQUIRE_LUA)
+        return bool(await script(keys=[self.semaphore_key], args=[self.max_concurrency, self.lease_ms, token]))
+
+    async def _take_token(self, redis: Any) -> float:
+        if self.rate_per_sec <= 0:
+            return 0.0
+        script = redis.register_script(_TOKEN_BUCKET_LUA)
+        return float(await script(keys=[self.bucket_key, self.pause_key], args=[self.rate_per_sec, self.burst]))
+
+    async def _mark_waiting(self, redis: Any, token: str) -> None:
+        # Waiters are sorted-set members scored by their expiry, so a worker that dies
+        # while waiting drops out of the gauge once its entry expires
+        now_ms = int(time.time() * 1000)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.waiting_key, "-inf", now_ms)
+            pipe.zadd(self.waiting_key, {token: now_ms + self.lease_ms})
+            pipe.pexpire(self.waiting_key, self.lease_ms)
+            await pipe.execute()
+
+    async def _renew_lease(self, token: str) -> None:
+        interval = max(self.lease_ms / 3000, 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                redis = get_redis_async()
+                script = redis.register_script(_SEMAPHORE_RENEW_LUA)
+                if not await script(keys=[self.semaphore_key], args=[self.lease_ms, token]):
+                    self.metrics["lost_leases"] += 1
+                    logger.warning(f"tdl slot lease lost for account={self.account}, token={token[:8]}")
+                    return
+            except Exception as e:
+                self.metrics["redis_errors"] += 1
+                logger.warning(f"tdl slot lease renewal failed: {e}")
+
+    async def _acquire(self, token: str) -> float:
+        """
+        Wait for a semaphore slot, then for a rate token. Returns seconds spent waiting.
+        """
+        redis = get_redis_async()
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout_sec
+        refresh_sec = max(self.lease_ms / 3000, 0.1)
+        await self._mark_waiting(redis, token)
+        marked_at = time.monotonic()
+        self.metrics["waiting"] += 1
+        try:
+            while not await self._try_acquire_slot(redis, token):
+                if time.monotonic() >= deadline:
+                    raise TdlGovernorTimeout(f"No tdl slot for account={self.account} within {self.acquire_timeout_sec}s")
+                await asyncio.sleep(_POLL_INTERVAL_SEC * random.uniform(0.5, 1.5))
+                if time.monotonic() - marked_at >= refresh_sec:
+                    await self._mark_waiting(redis, token)
+                    marked_at = time.monotonic()
+            try:
+                while True:
+                    wait = await self._take_token(redis)
+                    if wait <= 0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TdlGovernorTimeout(f"No tdl rate token for account={self.account} within {self.acquire_timeout_sec}s")
+                    # Wake up at least once per refresh interval to keep the waiter entry alive
+                    await asyncio.sleep(min(wait, remaining, refresh_sec))
+                    await self._mark_waiting(redis, token)
+            except BaseException:
+                await redis.zrem(self.semaphore_key, token)
+                raise
+        except TdlGovernorTimeout:
+            self.metrics["acquire_timeouts"] += 1
+            raise
+        finally:
+            self.metrics["waiting"] -= 1
+            try:
+                await redis.zrem(self.waiting_key, token)
+            except Exception as e:
+                logger.warning(f"Failed to update tdl waiters gauge: {e}")
+        waited = time.monotonic() - started
+        self.metrics["acquired"] += 1
+        self.metrics["wait_sec_total"] += waited
+        self.metrics["wait_sec_max"] = max(self.metrics["wait_sec_max"], waited)
+        return waited
+
+    @asynccontextmanager
+    async def slot(self, stats: Optional[dict] = None) -> AsyncIterator[None]:
+        """
+        Hold one tdl slot for the account while the block runs.
+
+        If Redis is unavailable the block runs ungoverned (logged), so a Redis outage
+        degrades to the previous behaviour rather than stopping all exports.
+
+        Args:
+            stats: Optional dict that receives `queue_wait_sec`.
+
+        Raises:
+            TdlGovernorTimeout: If no slot/token was obtained within the acquire timeout.
+        """
+        token = uuid.uuid4().hex
+        waited: Optional[float] = None
+        try:
+            waited = await self._acquire(token)
+        except TdlGovernorTimeout:
+            raise
+        except Exception as e:
+            self.metrics["redis_errors"] += 1
+            logger.warning(f"tdl governor unavailable, running ungoverned: {e}")
+        if waited is None:
+            yield
+            return
+        if stats is not None:
+            stats["queue_wait_sec"] = round(waited, 3)
+        if waited >= 1:
+            logger.info(f"Waited {waited:.1f}s for a tdl slot (account={self.account})")
+        renewer = asyncio.create_task(self._renew_lease(token))
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            try:
+                await get_redis_async().zrem(self.semaphore_key, token)
+            except Exception as e:
+                self.metrics["redis_errors"] += 1
+                logger.warning(f"Failed to release tdl slot, lease will expire: {e}")
+
+    async def pause(self, seconds: int) -> None:
+        """
+        Stop handing out rate tokens cluster-wide for the given number of seconds.
+        """
+        self.metrics["flood_waits"] += 1
+        logger.warning(f"tdl FLOOD_WAIT for account={self.account}: pausing all workers for {seconds}s")
+        await get_redis_async().set(self.pause_key, "1", px=int(seconds * 1000))
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """
+        Cluster-wide view of the account's limiter: slots in use, waiters, pause left.
+        """
+        redis = get_redis_async()
+        now_ms = int(time.time() * 1000)
+        in_flight = await redis.zcount(self.semaphore_key, now_ms, "+inf")
+        waiting = await redis.zcount(self.waiting_key, now_ms, "+inf")
+        pause_ms = await redis.pttl(self.pause_key)
+        return {
+            "account": self.account,
+            "in_flight": in_flight,
+            "waiting": waiting,
+            "paused_sec": max(pause_ms, 0) / 1000,
+            "local": dict(self.metrics),
+        }
+
+_governor: Optional[TdlGovernor] = None
+
+def get_tdl_governor() -> TdlGovernor:
+    """
+    Return the process-wide tdl governor for the configured account.
+    """
+    global _governor
+    if _governor is None:
+        _governor = TdlGovernor(
+            account=settings.TDL_ACCOUNT_NAME,
+            max_concurrency=settings.TDL_MAX_CONCURRENCY,
+            rate_per_sec=settings.TDL_RATE_PER_SEC,
+            burst=settings.TDL_RATE_BURST,
+            lease_sec=settings.TDL_SLOT_LEASE_SEC,
+            acquire_timeout_sec=settings.TDL_ACQUIRE_TIMEOUT_SEC,
+        )
+    return _governor
+
+async def execute_governed_tdl_command(
+    args: List[str],
+    timeout_sec: int = 300,
+    stats: Optional[dict] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """
+    Run execute_tdl_command under the cluster-wide tdl governor.
+
+    Args:
+        args: Command arguments (e.g. ['chat', 'export', ...])
+        timeout_sec: Max seconds for the command itself (queueing is not counted).
+        stats: Optional dict that receives `queue_wait_sec`.
+        on_progress: Passed through to execute_tdl_command.
+
+    Returns:
+        The execute_tdl_command result.
+
+    Raises:
+        TdlExecutionError: On tdl failure, or TdlGovernorTimeout if no slot was obtained.
+    """
+    if not settings.TDL_GOVERNOR_ENABLED:
+        return await execute_tdl_command(args, timeout_sec=timeout_sec, on_progress=on_progress)
+    governor = get_tdl_governor()
+    async with governor.slot(stats):
+        try:
+            return await execute_tdl_command(args, timeout_sec=timeout_sec, on_progress=on_progress)
+        except TdlExecutionError as e:
+            match = _FLOOD_WAIT_RE.search(str(e))
+            if match:
+                try:
+                    await governor.pause(int(match.group(1)))
+                except Exception as pause_error:
+                    logger.warning(f"Failed to record FLOOD_WAIT pause: {pause_error}")
+            raise
+
+# --- Pytest skeleton ---
+
+"""
+import pytest
+from app.worker.tdl_governor import TdlGovernor, _FLOOD_WAIT_RE
+
+def test_flood_wait_pattern():
+    assert _FLOOD_WAIT_RE.search("rpc error code 420: FLOOD_WAIT (30)").group(1) == "30"
+    assert _FLOOD_WAIT_RE.search("FLOOD_WAIT_17").group(1) == "17"
+
+@pytest.mark.asyncio
+async def test_slot_limits_concurrency():
+    # Requires a Redis server: two governors sharing an account with max_concurrency=1
+    # must never be inside slot() at the same time.
+    pass
+"""
@@ -1,17 +1,59 @@
 # Text cleaning utilities
 
+import json
 import re
 import logging
-from typing import Optional, Dict, Any
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger("telegram_insight_agent.text_cleaner")
 
+_URL_RE = re.compile(r"https?://\S+")
+# "@" is not \w and U+2063 is neither "@" nor \w, so mention and placeholder matches
+# can never overlap and one alternation pass removes exactly what two passes did.
+# URLs stay a separate, earlier pass: a URL may contain "@" or U+2063.
+_MENTION_OR_PLACEHOLDER_RE = re.compile(r"@\w+|\u2063")
+_MIN_CLEANED_CHARS = 3
+
+def clean_tdl_messages(messages: Iterable[Dict[str, Any]]) -> Iterator[Optional[str]]:
+    """
+    Clean a batch of tdl message dicts, yielding one result per input message.
+
+    Produces exactly what clean_tdl_message_text would for each message, but with
+    precompiled patterns, substring checks that skip regexes that cannot match, and no
+    per-message logging.
+
+    Args:
+        messages: Iterable of tdl message dicts.
+
+    Yields:
+        Cleaned string, or None if the message is unsuitable (aligned with the input).
+    """
+    url_sub = _URL_RE.sub
+    mention_sub = _MENTION_OR_PLACEHOLDER_RE.sub
+    for message_obj in messages:
+        try:
+            text = message_obj.get("text", "")
+            if not text or not isinstance(text, str) or message_obj.get("service"):
+                yield None
+                continue
+            if "http" in text:
+                text = url_sub("", text)
+            if "@" in text or "\u2063" in text:
+                text = mention_sub("", text)
+            # Same result as re.sub(r"\s+", " ", text).strip(): both use str.isspace()
+            text = " ".join(text.split())
+            yield text if len(text) >= _MIN_CLEANED_CHARS else None
+        except Exception as e:
+            logger.exception(f"Error cleaning message: {e}, message_obj={message_obj}")
+            yield None
+
 def clean_tdl_message_text(message_obj: Dict[str, Any]) -> Optional[str]:
     """
     Clean a Telegram message dict from tdl export for summarization.
 
     Removes system/service messages, URLs, user mentions, media placeholders, and excess whitespace.
-    Skips short or empty results.
+    Skips short or empty results. Prefer clean_tdl_messages() for whole exports.
 
     Args:
         message_obj: A tdl message dict.
@@ -19,39 +61,69 @@ def clean_tdl_message_text(message_obj: Dict[str, Any]) -> Optional[str]:
     Returns:
         Cleaned string, or None if unsuitable.
     """
-    try:
-        text = message_obj.get("text", "")
-        logger.debug(f"Cleaning message: {text!r}")
-        if not text or not isinstance(text, str):
-            logger.debug("No text in message or not a string")
-            return None
-        # Remove system messages or service types
-        if message_obj.get("service"):
-            logger.debug("Skipping system/service message")
-            return None
-        # Remove URLs
-        text = re.sub(r"https?://\S+", "", text)
-        # Remove user mentions ("@username")
-        text = re.sub(r"@\w+", "", text)
-        # Remove media placeholder
-        text = re.sub(r"\u2063", "", text)
-        # Remove extra whitespace
-        text = re.sub(r"\s+", " ", text).strip()
-        # Skip very short or empty results
-        if len(text) < 3:
-            logger.debug("Message too short after cleaning")
-            return None
-        logger.debug(f"Cleaned message: {text!r}")
-        return text
-    except Exception as e:
-        logger.exception(f"Error cleaning message: {e}, message_obj={message_obj}")
-        return None
+    return next(clean_tdl_messages((message_obj,)))
+
+def format_history_line(msg: Dict[str, Any], cleaned: str) -> str:
+    """
+    Prefix a cleaned message with its UTC timestamp when tdl exported one.
+
+    The `[YYYY-MM-DD HH:MM]` prefix gives the LLM a timeline and lets the token
+    budgeter spread the input across days.
+    """
+    date = msg.get("date")
+    if isinstance(date, int) and date > 0:
+        return f"[{datetime.fromtimestamp(date, tz=timezone.utc):%Y-%m-%d %H:%M}] {cleaned}"
+    return cleaned
+
+def clean_history_batch(messages: List[Dict[str, Any]], skip_through_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Clean and format one batch of an export into segment-store records.
+
+    Top-level and free of app imports so it can run in a worker process.
+
+    Args:
+        messages: tdl message dicts, in export order.
+        skip_through_id: Messages with an id at or below this are already stored; drop them.
+
+    Returns:
+        Dict with `records` (newline-joined JSON lines `{"id", "date", "text"}`), `count`,
+        the id/date range of the records (`min_id`, `max_id`, `min_date`, `max_date`)
+        and `max_message_id`, the highest id in the batch including dropped messages.
+    """
+    records = []
+    ids = []
+    dates = []
+    max_message_id = None
+    for msg, cleaned in zip(messages, clean_tdl_messages(messages)):
+        msg_id = msg.get("id")
+        if isinstance(msg_id, int):
+            if max_message_id is None or msg_id > max_message_id:
+                max_message_id = msg_id
+            if skip_through_id is not None and msg_id <= skip_through_id:
+                continue
+        if cleaned:
+            date = msg.get("date")
+            date = date if isinstance(date, int) and date > 0 else None
+            records.append(json.dumps({"id": msg_id, "date": date, "text": format_history_line(msg, cleaned)}, ensure_ascii=False))
+            if isinstance(msg_id, int):
+                ids.append(msg_id)
+            if date is not None:
+                dates.append(date)
+    return {
+        "records": "\n".join(records),
+        "count": len(records),
+        "min_id": min(ids) if ids else None,
+        "max_id": max(ids) if ids else None,
+        "min_date": min(dates) if dates else None,
+        "max_date": max(dates) if dates else None,
+        "max_message_id": max_message_id,
+    }
 
 # --- Pytest skeleton ---
 
 """
 import pytest
-from app.worker.text_cleaner import clean_tdl_message_text
+from app.worker.text_cleaner import clean_tdl_message_text, clean_tdl_messages
 
 def test_clean_url_removal():
     msg = {"text": "Check this https://example.com"}
@@ -76,4 +148,14 @@ def test_short_message():
 def test_unicode_media_placeholder():
     msg = {"text": "photo\u2063"}
     assert clean_tdl_message_text(msg) == "photo"
-"""
\ No newline at end of file
+
+def test_clean_history_batch_formats_and_tracks_ids():
+    from app.worker.text_cleaner import clean_history_batch
+    batch = clean_history_batch([{"id": 7, "date": 0, "text": "hello there"}, {"id": 9, "text": ""}])
+    assert batch["records"] == '{"id": 7, "date": null, "text": "hello there"}'
+    assert (batch["count"], batch["max_id"], batch["max_message_id"]) == (1, 7, 9)
+
+def test_batch_is_aligned_with_input():
+    msgs = [{"text": "hello world"}, {"text": ""}, None, {"text": "@a hi there"}]
+    assert list(clean_tdl_messages(msgs)) == ["hello world", None, None, "hi there"]
+"""
@@ -0,0 +1,179 @@
+# Token counting and input budgeting for LLM calls
+
+"""
+Token-aware input budgeting for LLM requests.
+
+Counts tokens with tiktoken when it is installed (optional dependency) and falls back
+to a conservative local estimate otherwise. The input budget is derived from the
+model's context size in Settings minus the prompt and the reserved output tokens, and
+histories that do not fit are sampled evenly across days instead of tail-truncated.
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.token_budget")
+
+# Chat-format overhead per message (role, separators) plus reply priming
+_MESSAGE_OVERHEAD_TOKENS = 8
+_DAY_PREFIX_RE = re.compile(r"^\[(\d{4}-\d{2}-\d{2})")
+_UNDATED = ""
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: str) -> Optional[Any]:
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken not installed, using approximate token counts")
+        return None
+    name = getattr(settings, "LLM_TOKENIZER_ENCODING", "") or None
+    try:
+        return tiktoken.get_encoding(name) if name else tiktoken.encoding_for_model(model)
+    except Exception:
+        logger.info(f"No tiktoken encoding for model={model}, using cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Count tokens in text for the given model.
+
+    Without tiktoken, ASCII is estimated at 4 characters per token and every other
+    character at one token, which over-counts rather than overflows on Cyrillic/CJK.
+
+    Args:
+        text: Text to count.
+        model: Model name (defaults to LLM_MODEL_NAME).
+
+    Returns:
+        Token count.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model or settings.LLM_MODEL_NAME)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def get_context_tokens(model: Optional[str] = None) -> int:
+    """
+    Return the context window size configured for a model.
+    """
+    model = model or settings.LLM_MODEL_NAME
+    limits: Dict[str, int] = settings.LLM_CONTEXT_TOKENS
+    if model in limits:
+        return limits[model]
+    # Allow dated variants such as "gpt-4o-2024-08-06" to match "gpt-4o"
+    for name in sorted(limits, key=len, reverse=True):
+        if model.startswith(name):
+            return limits[name]
+    return settings.LLM_DEFAULT_CONTEXT_TOKENS
+
+def input_budget(prompt: str, max_tokens: int, model: Optional[str] = None) -> int:
+    """
+    Tokens available for the user message once the prompt and output are reserved.
+
+    Args:
+        prompt: System prompt sent with the request.
+        max_tokens: Tokens reserved for the completion.
+        model: Model name (defaults to LLM_MODEL_NAME).
+
+    Returns:
+        Input token budget (at least 1).
+    """
+    budget = (
+        get_context_tokens(model)
+        - max_tokens
+        - count_tokens(prompt, model)
+        - 2 * _MESSAGE_OVERHEAD_TOKENS
+        - settings.LLM_INPUT_SAFETY_MARGIN_TOKENS
+    )
+    if settings.LLM_MAX_INPUT_TOKENS > 0:
+        budget = min(budget, settings.LLM_MAX_INPUT_TOKENS)
+    return max(1, budget)
+
+def allocate_budget(history_text: str, budget_tokens: int, model: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Fit cleaned history into a token budget, spreading it evenly across days.
+
+    Lines are grouped by their `[YYYY-MM-DD ...]` prefix. Days that fit their fair share
+    are kept whole; the leftover is shared among larger days, which are sampled at an
+    even stride so every part of the day stays represented. Line order is preserved.
+
+    Args:
+        history_text: Newline-separated cleaned messages.
+        budget_tokens: Maximum tokens for the result.
+        model: Model name (defaults to LLM_MODEL_NAME).
+
+    Returns:
+        (selected history text, token count of the selection).
+    """
+    lines = history_text.split("\n")
+    costs = [count_tokens(line, model) + 1 for line in lines]
+    total = sum(costs)
+    if total <= budget_tokens:
+        return history_text, total
+
+    days: "OrderedDict[str, List[int]]" = OrderedDict()
+    for idx, line in enumerate(lines):
+        match = _DAY_PREFIX_RE.match(line)
+        days.setdefault(match.group(1) if match else _UNDATED, []).append(idx)
+    day_totals = {day: sum(costs[i] for i in idxs) for day, idxs in days.items()}
+
+    # Water-filling: smallest days first, each gets min(its size, fair share of what is left)
+    allocation: Dict[str, int] = {}
+    remaining = budget_tokens
+    ordered_days = sorted(days, key=lambda d: day_totals[d])
+    for n, day in enumerate(ordered_days):
+        share = remaining // (len(ordered_days) - n)
+        allocation[day] = min(day_totals[day], share)
+        remaining -= allocation[day]
+
+    selected: List[int] = []
+    used = 0
+    for day, idxs in days.items():
+        allowed = allocation[day]
+        if allowed >= day_totals[day]:
+            selected.extend(idxs)
+            used += day_totals[day]
+            continue
+        fraction = allowed / day_totals[day]
+        acc = 0.0
+        spent = 0
+        for i in idxs:
+            acc += fraction
+            if acc >= 1.0 and spent + costs[i] <= allowed:
+                selected.append(i)
+                spent += costs[i]
+                acc -= 1.0
+        used += spent
+    selected.sort()
+    logger.info(
+        f"Budgeted history: kept {len(selected)}/{len(lines)} lines across {len(days)} day(s), "
+        f"{used}/{total} tokens (budget {budget_tokens})"
+    )
+    return "\n".join(lines[i] for i in selected), used
+
+# --- Pytest skeleton ---
+
+"""
+from app.worker.token_budget import allocate_budget, count_tokens
+
+def test_allocate_budget_keeps_everything_when_it_fits():
+    text = "[2024-01-01 10:00] hello\\n[2024-01-02 10:00] world"
+    assert allocate_budget(text, 10_000)[0] == text
+
+def test_allocate_budget_covers_every_day():
+    lines = [f"[2024-01-0{d} 10:{m:02d}] message {m} " + "x" * 40 for d in range(1, 4) for m in range(50)]
+    kept, used = allocate_budget("\\n".join(lines), 300)
+    assert used <= 300
+    assert all(f"[2024-01-0{d}" in kept for d in range(1, 4))
+
+def test_count_tokens_counts_non_ascii_conservatively():
+    assert count_tokens("привет") >= 3
+"""
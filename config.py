@@ -3,6 +3,7 @@ Configuration (env/Pydantic) for Telegram Insight Agent.
 """
 
 import logging
+from typing import Dict, Optional
 from pydantic import BaseSettings, ValidationError
 
 logger = logging.getLogger("telegram_insight_agent.config")
@@ -18,9 +19,93 @@ class Settings(BaseSettings):
     TELEGRAM_SESSION_PATH: str
     TDL_CONFIG_DIR: str
     TDL_OUTPUT_DIR_BASE: str
+    TDL_HISTORY_TIMEOUT_SEC: int = 600
+    TDL_PARTICIPANTS_TIMEOUT_SEC: int = 300
+    TDL_PROGRESS_MIN_INTERVAL_SEC: float = 3.0
+    TDL_OUTPUT_TAIL_LINES: int = 50
+    TDL_GOVERNOR_ENABLED: bool = True
+    TDL_ACCOUNT_NAME: str = "default"
+    TDL_MAX_CONCURRENCY: int = 1  # tdl locks the account's session storage; >1 fails on one TDL_CONFIG_DIR
+    TDL_RATE_PER_SEC: float = 0.5
+    TDL_RATE_BURST: int = 3
+    TDL_SLOT_LEASE_SEC: float = 60.0
+    TDL_ACQUIRE_TIMEOUT_SEC: float = 900.0
+    SEGMENT_MAX_LINES: int = 50000
+    SUMMARY_WINDOW_HOURS: float = 0
+    DEDUP_ENABLED: bool = True
+    DEDUP_DEFAULT_THRESHOLD: int = 3
+    SCHEDULE_DEFAULT_INTERVAL_SEC: int = 3600
+    SCHEDULE_DEFAULT_JITTER_SEC: int = 120
+    SCHEDULE_MIN_INTERVAL_SEC: int = 300
+    SCHEDULER_POLL_INTERVAL_SEC: float = 10.0
+    SCHEDULER_BATCH_SIZE: int = 500
+    RQ_HIGH_PRIORITY_QUEUE: str = "high"
+    RQ_LOW_PRIORITY_QUEUE: str = "low"
+    RQ_JOB_TIMEOUT_SEC: int = 0  # 0 = derived from the tdl, governor and LLM timeouts
+    WORKER_PROCESSES: int = 1
+    WORKER_RESERVED_HIGH: int = 0
+    WORKER_EXECUTION: str = "inline"
+    ASYNC_CONSUMER_CONCURRENCY: int = 20
+    ASYNC_CONSUMER_DRAIN_TIMEOUT_SEC: float = 600.0
+    ASYNC_CONSUMER_HEARTBEAT_TTL_SEC: float = 60.0
+    COALESCE_ENABLED: bool = True
+    COALESCE_LEASE_SEC: float = 60.0
+    COALESCE_QUEUED_LEASE_SEC: float = 3600.0
+    CLEAN_PARALLEL_ENABLED: bool = True
+    CLEAN_PARALLEL_THRESHOLD: int = 200000
+    CLEAN_PARALLEL_WORKERS: int = 0
+    CLEAN_CHUNK_SIZE: int = 5000
     LLM_API_KEY: str
     LLM_ENDPOINT_URL: str = "https://api.openai.com/v1/chat/completions"
     LLM_MODEL_NAME: str = "gpt-3.5-turbo"
+    LLM_CONTEXT_TOKENS: Dict[str, int] = {
+        "gpt-3.5-turbo": 16385,
+        "gpt-4": 8192,
+        "gpt-4-turbo": 128000,
+        "gpt-4o": 128000,
+        "gpt-4o-mini": 128000,
+    }
+    LLM_DEFAULT_CONTEXT_TOKENS: int = 8192
+    LLM_MAX_INPUT_TOKENS: int = 0  # optional cap on input tokens per request; 0 = model context only
+    LLM_INPUT_SAFETY_MARGIN_TOKENS: int = 256
+    LLM_TOKENIZER_ENCODING: str = ""  # tiktoken encoding override, e.g. "cl100k_base"
+    LLM_MAP_REDUCE_ENABLED: bool = True
+    LLM_MAP_CONCURRENCY: int = 4
+    LLM_MAP_MAX_TOKENS: int = 512
+    LLM_MAP_MAX_ROUNDS: int = 3
+    LLM_STAGE_TIMEOUT_SEC: float = 900.0
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL_SEC: int = 86400
+    LLM_CACHE_LOCAL_MAX_ENTRIES: int = 256
+    LLM_HTTP_MAX_CONNECTIONS: int = 20
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_HTTP_KEEPALIVE_EXPIRY_SEC: float = 60.0
+    LLM_HTTP2: bool = False
+    LLM_CONNECT_TIMEOUT_SEC: float = 10.0
+    LLM_READ_TIMEOUT_SEC: float = 120.0
+    LLM_WRITE_TIMEOUT_SEC: float = 30.0
+    LLM_POOL_TIMEOUT_SEC: float = 10.0
+    JOB_EVENTS_STREAM: str = "job_events"
+    JOB_EVENTS_GROUP: str = "userbot"
+    JOB_EVENTS_CONSUMER: str = ""  # defaults to the host name; keep stable across restarts
+    JOB_EVENTS_MAXLEN: int = 10000
+    JOB_EVENTS_CLAIM_IDLE_SEC: float = 60.0
+    JOB_EVENTS_MAX_DELIVERIES: int = 5
+    EVENT_DISPATCH_SHARDS: int = 16
+    EVENT_DISPATCH_QUEUE_SIZE: int = 100
+    EVENT_DISPATCH_LAG_WARN_SEC: float = 30.0  # 0 disables the warning
+    STATUS_FLUSH_INTERVAL_SEC: float = 2.0
+    STATUS_EDIT_GAP_SEC: float = 0.1
+    STATUS_MSG_TTL_SEC: int = 604800
+    STATUS_MSG_LOCAL_MAX_ENTRIES: int = 1024
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT_SEC: float = 5.0
+    REDIS_HEALTH_CHECK_INTERVAL_SEC: int = 30
+    REDIS_CONNECT_TIMEOUT_SEC: float = 5.0
+    REDIS_SOCKET_TIMEOUT_SEC: Optional[float] = None
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_RECYCLE_SEC: int = 1800
 
 try:
     settings = Settings()
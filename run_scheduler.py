@@ -4,9 +4,12 @@ Entrypoint for RQ scheduler service for Telegram Insight Agent.
 
 import asyncio
 import logging
+import time
 from typing import NoReturn
 from app.shared.database import async_sessionmaker
-from app.worker.tasks import periodic_monitoring_check
+from app.shared.db_crud import claim_due_chats
+from app.worker.tasks import enqueue_monitoring_runs
+from config import settings
 
 logger = logging.getLogger("telegram_insight_agent.run_scheduler")
 
@@ -14,30 +17,31 @@ def main() -> NoReturn:
     """
     Start the RQ scheduler loop for periodic background task enqueuing.
     """
-    logger.info("RQ Scheduler started. Will periodically trigger periodic_monitoring_check for all users with monitored chats.")
+    logger.info("RQ Scheduler started. Will enqueue process_monitored_chat for each monitored chat when it is due.")
     loop = asyncio.get_event_loop()
     loop.run_until_complete(scheduler_loop())
 
 async def scheduler_loop() -> None:
     """
-    Enqueue periodic monitoring jobs for each user with monitored chats.
+    Claim due monitored chats and enqueue a monitoring job for each.
+
+    Polls every SCHEDULER_POLL_INTERVAL_SEC. A poll that claims a full batch is
+    followed by another one straight away, so a backlog drains without waiting.
     """
     while True:
         try:
+            started = time.perf_counter()
             async with async_sessionmaker() as session:
-                # Get all distinct user_ids with active monitored chats
-                users = await session.execute(
-                    "SELECT DISTINCT user_id FROM monitored_chats WHERE is_active = true"
-                )
-                user_ids = [row[0] for row in users.fetchall()]
-                logger.info(f"Scheduler: Found {len(user_ids)} monitored users.")
-                for user_id in user_ids:
-                    try:
-                        periodic_monitoring_check(user_id)
-                        logger.debug(f"Scheduled periodic check for user_id={user_id}")
-                    except Exception as e:
-                        logger.error(f"Error scheduling for user {user_id}: {e}")
-            await asyncio.sleep(3600)  # Run every hour
+                claimed = await claim_due_chats(session, settings.SCHEDULER_BATCH_SIZE)
+                # One pipelined round trip for the whole batch
+                enqueued = enqueue_monitoring_runs([monitored_chat_id for monitored_chat_id, _ in claimed])
+                # Commit only after enqueueing: if Redis fails the claims roll back and retry
+                await session.commit()
+            if claimed:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                logger.info(f"Scheduler: Enqueued {enqueued} due chat(s) in {elapsed_ms:.1f} ms.")
+            if len(claimed) < settings.SCHEDULER_BATCH_SIZE:
+                await asyncio.sleep(settings.SCHEDULER_POLL_INTERVAL_SEC)
         except Exception as e:
             logger.error(f"Scheduler main loop error: {e}")
             await asyncio.sleep(60)  # Backoff and retry
@@ -54,4 +58,11 @@ import run_scheduler
 
 def test_main_importable():
     assert hasattr(run_scheduler, "main")
-"""
\ No newline at end of file
+
+@pytest.mark.asyncio
+async def test_scheduler_enqueues_claimed_chats(monkeypatch):
+    # Patch claim_due_chats to return [(1, 10), (2, 10)] once and then raise
+    # asyncio.CancelledError; assert enqueue_monitoring_runs got [1, 2] in a single
+    # call and the session committed.
+    pass
+"""
@@ -20,7 +20,7 @@ def main() -> NoReturn:
     logger.info("Starting Telethon userbot main routine.")
     register_handlers()
     loop = asyncio.get_event_loop()
-    # Start Redis pub/sub for job status (runs forever)
+    # Consume job status events from the Redis stream (runs forever)
     loop.create_task(listen_for_job_events(client, settings))
     logger.info("Starting Telethon client event loop.")
     try:
@@ -2,24 +2,41 @@
 Entrypoint for RQ worker service for Telegram Insight Agent.
 """
 
+import argparse
 import logging
+import os
 from typing import NoReturn
-from rq import Worker
-from app.shared.redis_client import get_redis_sync
-import app.worker.tasks  # noqa: F401, ensure tasks are registered
+from app.worker.lanes import worker_queue_names
+from app.worker.launcher import EXECUTION_MODES, WorkerPool, work
+from config import settings
 
 logger = logging.getLogger("telegram_insight_agent.run_worker")
 
 def main() -> NoReturn:
     """
-    Start the RQ worker for background job processing.
+    Start the RQ worker(s) for background job processing.
+
+    Workers listen to the high-priority (manual) queue first, then the low-priority
+    (scheduled) one. With more than one worker, a supervising parent forks them after
+    preloading the task modules (see app.worker.launcher).
     """
+    parser = argparse.ArgumentParser(description="Telegram Insight Agent RQ worker")
+    parser.add_argument("--workers", type=int, default=settings.WORKER_PROCESSES,
+                        help="number of worker processes (0 = one per CPU core)")
+    parser.add_argument("--reserved-high", type=int, default=settings.WORKER_RESERVED_HIGH,
+                        help="workers that only take manual runs from the high-priority queue")
+    parser.add_argument("--high-only", action="store_true", help="single worker: only take manual runs")
+    parser.add_argument("--execution", choices=EXECUTION_MODES, default=settings.WORKER_EXECUTION,
+                        help="inline: run jobs in the worker process; fork: fork a process per job; "
+                             "async: run many jobs concurrently per process")
+    args = parser.parse_args()
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
     logger.info("Starting RQ Worker main routine.")
     try:
-        redis_conn = get_redis_sync()
-        worker = Worker(["default"], connection=redis_conn)
-        logger.info("RQ Worker starting...")
-        worker.work()
+        if workers > 1:
+            WorkerPool(workers, reserved_high=args.reserved_high, execution=args.execution).run()
+        else:
+            work(worker_queue_names(high_only=args.high_only or args.reserved_high > 0), args.execution)
     except Exception as e:
         logger.error(f"RQ Worker crashed: {e}")
         raise
@@ -37,4 +54,4 @@ from unittest.mock import patch
 def test_main_importable():
     import run_worker
     assert hasattr(run_worker, "main")
-"""
\ No newline at end of file
+"""
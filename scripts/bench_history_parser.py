@@ -0,0 +1,111 @@
+"""
+Memory benchmark: json.load vs streaming reader for tdl history exports.
+
+Usage:
+    python -m scripts.bench_history_parser --messages 500000
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Tuple
+
+from app.worker.history_reader import iter_tdl_messages
+from app.worker.text_cleaner import clean_tdl_message_text
+
+logger = logging.getLogger("telegram_insight_agent.scripts.bench_history_parser")
+
+def write_synthetic_export(path: str, message_count: int) -> None:
+    """
+    Write a tdl-shaped export with message_count text messages, streamed like tdl does.
+
+    Args:
+        path: Output file path.
+        message_count: Number of messages to write.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"id":1234567890,"messages":[')
+        for i in range(message_count):
+            if i:
+                f.write(",")
+            msg = {
+                "id": message_count - i,
+                "type": "message",
+                "file": "",
+                "date": 1700000000 + i,
+                "text": f"Message {i} from @user{i % 97} about https://example.com/{i} and some more words",
+            }
+            f.write(json.dumps(msg))
+        f.write("]}")
+
+def clean_with_json_load(src: str, dst: str) -> int:
+    """
+    Previous approach: load the whole document, build all lines, join, write.
+    """
+    with open(src, "r", encoding="utf-8") as f:
+        history_data = json.load(f)
+    cleaned_lines = []
+    for msg in history_data.get("messages", []):
+        cleaned = clean_tdl_message_text(msg)
+        if cleaned:
+            cleaned_lines.append(cleaned)
+    with open(dst, "w", encoding="utf-8") as f:
+        f.write("\n".join(cleaned_lines))
+    return len(cleaned_lines)
+
+def clean_streaming(src: str, dst: str) -> int:
+    """
+    Streaming approach: one message in memory at a time, written as it is cleaned.
+    """
+    count = 0
+    with open(dst, "w", encoding="utf-8") as out:
+        for msg in iter_tdl_messages(src):
+            cleaned = clean_tdl_message_text(msg)
+            if cleaned:
+                if count:
+                    out.write("\n")
+                out.write(cleaned)
+                count += 1
+    return count
+
+def measure(func: Callable[[str, str], int], src: str, dst: str) -> Tuple[int, float, int]:
+    """
+    Run func under tracemalloc.
+
+    Returns:
+        (peak bytes allocated, seconds elapsed, lines written).
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    lines = func(src, dst)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, lines
+
+def main() -> None:
+    """
+    Generate a synthetic export and compare peak memory of both cleaning paths.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200_000, help="number of synthetic messages")
+    args = parser.parse_args()
+    # Keep per-message debug logging out of the measurement
+    logging.getLogger("telegram_insight_agent.text_cleaner").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "history.json")
+        write_synthetic_export(src, args.messages)
+        size_mb = os.path.getsize(src) / 1e6
+        logger.info(f"Synthetic export: {args.messages} messages, {size_mb:.1f} MB")
+        for name, func in (("json.load", clean_with_json_load), ("streaming", clean_streaming)):
+            peak, elapsed, lines = measure(func, src, os.path.join(tmp, f"cleaned_{name}.txt"))
+            logger.info(f"{name:>10}: peak={peak / 1e6:8.1f} MB  time={elapsed:6.2f}s  lines={lines}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,124 @@
+"""
+Latency benchmark: new httpx client per LLM call vs the shared LLM client.
+
+Starts a local OpenAI-compatible stub endpoint and issues the same request both ways:
+once through a fresh httpx client per call (the previous behaviour) and once through
+llm_service._chat_completion, i.e. the client built by get_llm_client() from the
+LLM_HTTP_* settings. LLM_API_KEY must be set (any value) for the settings to load.
+
+Usage:
+    python -m scripts.bench_llm_client --requests 500
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from typing import List, Optional
+
+import httpx
+
+from app.worker import llm_service
+from config import settings
+
+logger = logging.getLogger("telegram_insight_agent.scripts.bench_llm_client")
+
+STUB_BODY = json.dumps({"choices": [{"message": {"content": "stub summary"}}]}).encode()
+
+async def _handle_stub_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Minimal HTTP/1.1 keep-alive responder returning a fixed chat completion.
+    """
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            if length:
+                await reader.readexactly(length)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(STUB_BODY)}\r\n\r\n".encode()
+                + STUB_BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+async def _call(client: httpx.AsyncClient, url: str) -> None:
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "x" * 2000}], "max_tokens": 16}
+    response = await client.post(url, json=payload, headers={"Authorization": "Bearer stub"})
+    response.raise_for_status()
+    response.json()["choices"][0]["message"]["content"]
+
+async def run_per_call(url: str, count: int) -> List[float]:
+    """
+    Previous behaviour: a fresh AsyncClient (and TCP connection) for every call.
+    """
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        async with httpx.AsyncClient(timeout=60) as client:
+            await _call(client, url)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+async def run_pooled(url: str, count: int) -> List[float]:
+    """
+    Current behaviour: every call goes through llm_service and its shared client.
+    """
+    settings.LLM_ENDPOINT_URL = url
+    latencies = []
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            await llm_service._chat_completion("stub", "x" * 2000, 16)
+            latencies.append(time.perf_counter() - started)
+    finally:
+        await llm_service.close_llm_client()
+    return latencies
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+async def _main(count: int, url: Optional[str]) -> None:
+    server = None
+    if url is None:
+        server = await asyncio.start_server(_handle_stub_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        url = f"http://127.0.0.1:{port}/v1/chat/completions"
+    logger.info(f"Benchmarking {count} requests against {url}")
+    try:
+        for name, runner in (("per-call", run_per_call), ("pooled", run_pooled)):
+            latencies = await runner(url, count)
+            logger.info(
+                f"{name:>9}: p50={statistics.median(latencies) * 1000:7.2f} ms  "
+                f"p95={_percentile(latencies, 0.95) * 1000:7.2f} ms  total={sum(latencies):6.2f}s"
+            )
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+def main() -> None:
+    """
+    Compare p50/p95 latency of per-call clients against the pooled client.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300, help="requests per mode")
+    parser.add_argument("--url", default=None, help="benchmark a real endpoint instead of the local stub")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger(llm_service.logger.name).setLevel(logging.WARNING)
+    asyncio.run(_main(args.requests, args.url))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -25,10 +25,24 @@ def test_imports():
     import app.userbot.client
     import app.userbot.handlers
     import app.userbot.state
+    import app.userbot.dispatcher
+    import app.userbot.status_renderer
     import app.userbot.ui
     import app.worker.llm_service
     import app.worker.text_cleaner
     import app.worker.tdl_executor
+    import app.worker.history_reader
+    import app.worker.runtime
+    import app.worker.token_budget
+    import app.worker.llm_cache
+    import app.worker.tdl_governor
+    import app.worker.clean_pool
+    import app.worker.segment_store
+    import app.worker.dedup
+    import app.worker.coalescing
+    import app.worker.lanes
+    import app.worker.async_consumer
+    import app.worker.launcher
     import app.worker.tasks
 
 @pytest.mark.asyncio